@@ -3,3 +3,4 @@
 __version__ = '2.0.0'
 
 from .resolver import get_resolver
+from .dataframe import resolve_dataframe
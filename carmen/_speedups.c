@@ -0,0 +1,120 @@
+/*
+ * Compiled implementations of hot paths in carmen.
+ *
+ * Each function here must return exactly what its pure-Python
+ * counterpart returns; carmen/scripts/check_speedups.py compares them.
+ */
+
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+static PyObject *special_tokens[3];
+static const char *special_token_strings[3] = {"<CITY>", "<ADMIN>", "<COUNTRY>"};
+static PyObject *empty_string;
+static PyObject *strip_name;
+static PyObject *lower_name;
+
+/* The characters matched by \w in a str pattern. */
+#define IS_WORD(ch) (Py_UNICODE_ISALNUM(ch) || (ch) == '_')
+
+/*
+ * Replace each run of whitespace in *name* with a single space, and
+ * each other non-word character with a space (or, if preserve_commas
+ * is true, commas with commas), as NORMALIZATION_RE.sub does.
+ */
+static PyObject *
+collapse(PyObject *name, int preserve_commas)
+{
+    Py_ssize_t length = PyUnicode_GET_LENGTH(name);
+    int kind = PyUnicode_KIND(name);
+    const void *data = PyUnicode_DATA(name);
+    Py_UCS4 *buffer = PyMem_New(Py_UCS4, length ? length : 1);
+    if (buffer == NULL)
+        return PyErr_NoMemory();
+    Py_ssize_t i = 0, j = 0;
+    while (i < length) {
+        Py_UCS4 ch = PyUnicode_READ(kind, data, i);
+        if (Py_UNICODE_ISSPACE(ch)) {
+            while (i < length &&
+                   Py_UNICODE_ISSPACE(PyUnicode_READ(kind, data, i)))
+                i++;
+            buffer[j++] = ' ';
+            continue;
+        }
+        if (!IS_WORD(ch) && !(preserve_commas && ch == ','))
+            ch = ' ';
+        buffer[j++] = ch;
+        i++;
+    }
+    /* This builds the string in its narrowest representation, which
+       str equality and hashing rely on. */
+    PyObject *result = PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND,
+                                                 buffer, j);
+    PyMem_Free(buffer);
+    return result;
+}
+
+static PyObject *
+normalize(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+    static char *keywords[] = {"location_name", "preserve_commas", NULL};
+    PyObject *name;
+    int preserve_commas = 0;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "U|p:normalize", keywords,
+                                     &name, &preserve_commas))
+        return NULL;
+    Py_INCREF(name);
+    for (int i = 0; i < 3; i++) {
+        PyObject *replaced = PyUnicode_Replace(name, special_tokens[i],
+                                               empty_string, -1);
+        Py_DECREF(name);
+        if (replaced == NULL)
+            return NULL;
+        name = replaced;
+    }
+    PyObject *collapsed = collapse(name, preserve_commas);
+    Py_DECREF(name);
+    if (collapsed == NULL)
+        return NULL;
+    PyObject *stripped = PyObject_CallMethodObjArgs(collapsed, strip_name, NULL);
+    Py_DECREF(collapsed);
+    if (stripped == NULL)
+        return NULL;
+    PyObject *lowered = PyObject_CallMethodObjArgs(stripped, lower_name, NULL);
+    Py_DECREF(stripped);
+    return lowered;
+}
+
+PyDoc_STRVAR(normalize_doc,
+"normalize(location_name, preserve_commas=False)\n\n"
+"A compiled implementation of carmen.resolvers.profile.normalize.");
+
+static PyMethodDef speedups_methods[] = {
+    {"normalize", (PyCFunction)(void (*)(void))normalize,
+     METH_VARARGS | METH_KEYWORDS, normalize_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "carmen._speedups",
+    "Compiled implementations of hot paths in carmen.",
+    -1,
+    speedups_methods
+};
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    for (int i = 0; i < 3; i++) {
+        special_tokens[i] = PyUnicode_InternFromString(special_token_strings[i]);
+        if (special_tokens[i] == NULL)
+            return NULL;
+    }
+    empty_string = PyUnicode_New(0, 0);
+    strip_name = PyUnicode_InternFromString("strip");
+    lower_name = PyUnicode_InternFromString("lower");
+    if (empty_string == NULL || strip_name == NULL || lower_name == NULL)
+        return NULL;
+    return PyModule_Create(&speedups_module);
+}
@@ -3,15 +3,26 @@ from __future__ import print_function
 
 import argparse
 import collections
-import gzip
 import json
 import jsonlines
 import sys
-import warnings
 
 
 from . import get_resolver
+from .diagnostics import Diagnostics, installed
+from .embedded import EmbeddedResolver
+from .extract import extract_geo
+from .io import open_file
 from .location import Location, LocationEncoder
+from .parallel import DEFAULT_CHUNK_SIZE, chunks, imap_chunks
+from .progress import Progress
+from .resolver import ConfidencePolicy
+from .profiling import (
+    NULL_STAGE, SamplingProfiler, StageTimes, instrument)
+
+
+TOP_COUNTRIES = 10
+"""The number of countries listed by ``--statistics``."""
 
 
 def parse_args():
@@ -30,6 +41,20 @@ def parse_args():
     parser.add_argument('--locations',
         metavar='PATH', dest='location_file',
         help='path to alternative location database')
+    parser.add_argument('--min-confidence',
+        metavar='X', type=float,
+        help='treat resolutions with confidence below X (between 0 and '
+             '1) as provisional, so that later resolvers are tried')
+    parser.add_argument('--adaptive',
+        action='store_true',
+        help='skip resolvers for tweets that lack the information they '
+             'need, and with --statistics report the calls, hit rate and '
+             'cost of each resolver; resolvers are still tried in order '
+             'and results are unchanged')
+    parser.add_argument('--accept-confidence',
+        metavar='X', type=float,
+        help='accept the first resolution with confidence of at least X, '
+             'even if provisional, without trying later resolvers')
     parser.add_argument('input_file', metavar='input_path',
         nargs='?', default=sys.stdin,
         help='file containing tweets to locate with geolocation field '
@@ -41,28 +66,76 @@ def parse_args():
     parser.add_argument('--debug', '-d', 
         action='store_true',
         help='turn on debug (verbose) mode')
+    parser.add_argument('--diagnostic-examples',
+        metavar='N', type=int, default=3,
+        help='number of example tweets to show for each kind of '
+             'data-quality issue (default: 3)')
+    parser.add_argument('--embedded',
+        action='store_true',
+        help='also resolve the original tweets embedded in retweets and '
+             'quoted tweets')
+    parser.add_argument('--embedded-cache-size',
+        metavar='N', type=int, default=100000,
+        help='number of embedded tweet resolutions to cache by tweet ID '
+             '(default: 100000)')
+    parser.add_argument('--profile',
+        action='store_true',
+        help='time each stage of processing (reading, decoding, '
+             'extraction, each resolver, encoding and writing) and '
+             'print a summary table at the end of the run')
+    parser.add_argument('--profile-output',
+        metavar='PATH',
+        help='with --profile, also sample the call stack and write the '
+             'samples to PATH in collapsed-stack (flame graph) format')
+    parser.add_argument('--profile-interval',
+        metavar='MS', type=float, default=5.0,
+        help='milliseconds between call stack samples (default: 5)')
+    parser.add_argument('--progress',
+        action='store_true',
+        help='show throughput, estimated time remaining and resolution '
+             'rates while running (uses tqdm if it is installed)')
+    parser.add_argument('--metrics-file',
+        metavar='PATH',
+        help='periodically write a JSON snapshot of progress metrics to '
+             'PATH')
+    parser.add_argument('--metrics-interval',
+        metavar='SECONDS', type=float, default=30.0,
+        help='seconds between metrics snapshots (default: 30)')
+    parser.add_argument('--batch-size',
+        metavar='N', type=int, default=1,
+        help='resolve tweets in batches of N, resolving each distinct '
+             'Place, coordinate pair and profile location in a batch '
+             'only once (default: 1, no batching); data-quality issues '
+             'are then counted once per distinct value')
+    parser.add_argument('--threads',
+        metavar='N', type=int, default=1,
+        help='resolve tweets on N threads, which share one copy of the '
+             'location database (default: 1); output order is '
+             'unchanged, and with --profile resolution is not timed by '
+             'resolver')
+    parser.add_argument('--chunk-size',
+        metavar='N', type=int, default=DEFAULT_CHUNK_SIZE,
+        help='with --threads, number of tweets handed to a thread at a '
+             'time (default: %d, and at least the batch size)'
+             % DEFAULT_CHUNK_SIZE)
     return parser.parse_args()
 
 
-def open_file(filename, mode):
-    # Check for stdin/stdout case
-    if "_io.TextIOWrapper" in str(filename.__class__):
-        return filename
-    # GZIP case
-    if filename.endswith('.gz'):
-        return gzip.open(filename, mode)
-    else:
-        return open(filename, mode)
-
-
 def main():
+    if sys.argv[1:2] == ['compile-locations']:
+        from .compile import main as compile_main
+        return compile_main(sys.argv[2:])
     args = parse_args()
-    warnings.simplefilter('always')
     resolver_kwargs = {}
     if args.order is not None:
         resolver_kwargs['order'] = args.order.split(',')
     if args.options is not None:
         resolver_kwargs['options'] = json.loads(args.options)
+    if args.adaptive:
+        resolver_kwargs['adaptive'] = True
+    if args.min_confidence is not None or args.accept_confidence is not None:
+        resolver_kwargs['policy'] = ConfidencePolicy(
+            minimum=args.min_confidence, accept=args.accept_confidence)
     resolver = get_resolver(**resolver_kwargs)
     
     resolver.load_locations(location_file=args.location_file)
@@ -70,79 +143,183 @@ def main():
     city_found = county_found = state_found = country_found = 0
     has_place = has_coordinates = has_geo = has_profile_location = 0
     resolution_method_counts = collections.defaultdict(int)
+    # Counts of the tweets resolved to each known location, by ID.
+    location_counts = collections.Counter()
     skipped_tweets = resolved_tweets = total_tweets = 0
+    embedded_resolved = 0
+    if args.embedded:
+        embedded_resolver = EmbeddedResolver(
+            resolver, cache_size=args.embedded_cache_size)
 
+    times = profiler = None
+    if args.profile:
+        times = StageTimes()
+        # List the stages in the order they run.
+        for name in ('read', 'decode', 'extract', 'resolve', 'embedded',
+                     'encode', 'write'):
+            if ((name != 'embedded' or args.embedded) and
+                    (name != 'resolve' or args.threads <= 1)):
+                times.stage(name)
+        if args.threads <= 1:
+            instrument(resolver, times)
+        stage = times.stage
+        if args.profile_output:
+            profiler = SamplingProfiler(interval=args.profile_interval / 1000)
+            profiler.start()
+    else:
+        stage = lambda name: NULL_STAGE
+
+    diagnostics = Diagnostics(max_examples=args.diagnostic_examples)
     fi = open_file(args.input_file, "rb")
     fo = open_file(args.output_file, 'wb')
-    with jsonlines.Writer(fo) as writer:
-        with jsonlines.Reader(fi) as reader:
-            for i, tweet in enumerate(reader.iter(skip_invalid=True, skip_empty=True)):
-                total_tweets += 1
-                if args.debug:
-                    # DEBUGGING
-                    print('-'*70)
-                    print(json.dumps(tweet, indent=4, sort_keys=True))
-                    print(type(tweet))
-                    data = tweet.get("data")
-                    includes = tweet.get("includes")
-                    geo = tweet.get("data", {}).get("geo")
-                    print("\ndata")
-                    print(data)
-                    print("\nincludes")
-                    print(includes)
-                    print("\ngeo")
-                    print(geo)
-                    # break
-                    # END DEBUGGING
-
-                # Show warnings from the input file, not the Python source code.
-                def showwarning(message, category, filename, lineno, file=sys.stderr, line=None):
-                    sys.stderr.write(
-                        warnings.formatwarning(message, category, args.input_file, i+1, line='')
-                    )
-                warnings.showwarning = showwarning
-                # Skip deleted and status_withheld tweets
-                if "delete" in tweet or "status_withheld" in tweet:
-                    skipped_tweets += 1
-                    continue
-
-                # TODO: in APIv2, statistics can't work like before since fields are different.
-                # Collect statistics on the tweet.
-                if tweet.get('place'):
-                    has_place += 1
-                if tweet.get('coordinates'):
-                    has_coordinates += 1
-                if tweet.get('geo'):
-                    has_geo += 1
-                if tweet.get('user', {}).get('location', ''):
-                    has_profile_location += 1
-                # Perform the actual resolution.
-                resolution = resolver.resolve_tweet(tweet)
-                if resolution:
-                    location = resolution[1]
-                    tweet['location'] = location
-                    # More statistics.
-                    resolution_method_counts[location.resolution_method] += 1
-                    if location.city:
-                        city_found += 1
-                    elif location.county:
-                        county_found += 1
-                    elif location.state:
-                        state_found += 1
-                    elif location.country:
-                        country_found += 1
-                    resolved_tweets += 1
-                try:
-                    json_output = json.dumps(tweet, cls=LocationEncoder).encode()
-                    writer.write(json_output)
-                except TypeError as err:
-                    json_output = json.dumps(tweet, cls=LocationEncoder)
-                    writer.write(json_output)
+    lines = fi if times is None else times.timed_iter('read', fi)
+    progress = None
+    if args.progress or args.metrics_file:
+        progress = Progress(fi, display=args.progress,
+                            metrics_file=args.metrics_file,
+                            metrics_interval=args.metrics_interval)
+    # Per-resolver stages cannot be timed on several threads at once.
+    resolve_stage = stage('resolve') if args.threads <= 1 else NULL_STAGE
+
+    def finish(tweet, resolution, mark):
+        """Record statistics on a resolved tweet and write it out.
+        *mark* is as given by read_tweets()."""
+        nonlocal city_found, county_found, state_found, country_found
+        nonlocal resolved_tweets, embedded_resolved
+        if resolution:
+            location = resolution.location
+            tweet['location'] = resolution
+            # More statistics.
+            resolution_method_counts[resolution.method] += 1
+            if location.city:
+                city_found += 1
+            elif location.county:
+                county_found += 1
+            elif location.state:
+                state_found += 1
+            elif location.country:
+                country_found += 1
+            if args.statistics and location.known:
+                location_counts[location.id] += 1
+            resolved_tweets += 1
+        if args.embedded:
+            with stage('embedded'):
+                embedded_resolved += embedded_resolver.annotate(tweet)
+        with stage('encode'):
+            json_output = json.dumps(tweet, cls=LocationEncoder)
+        with stage('write'):
+            writer.write(json_output)
+        if progress is not None:
+            # Count the tweets read up to this one, rather than all the
+            # tweets read so far, some of which may still be waiting to
+            # be resolved.
+            tweets_done, position = mark
+            if tweets_done >= progress.next_check:
+                progress.update(tweets_done, resolved_tweets,
+                                resolution_method_counts, position=position)
+
+    def read_tweets():
+        """Yield a ``(tweet, geo, line_number, mark)`` tuple for each
+        tweet to resolve, and collect statistics on them.  With progress
+        reporting, *mark* is a pair of the number of tweets read so far,
+        including this one and any skipped, and the input position after
+        it; otherwise it is None."""
+        nonlocal total_tweets, skipped_tweets
+        nonlocal has_place, has_coordinates, has_geo, has_profile_location
+        for line_number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                with stage('decode'):
+                    tweet = json.loads(line)
+            except ValueError:
+                continue
+            if not isinstance(tweet, dict):
+                continue
+            total_tweets += 1
+            # Attribute data-quality issues to the input line.
+            diagnostics.line = line_number
+            if args.debug:
+                # DEBUGGING
+                print('-'*70)
+                print(json.dumps(tweet, indent=4, sort_keys=True))
+                print(type(tweet))
+                data = tweet.get("data")
+                includes = tweet.get("includes")
+                geo = tweet.get("data", {}).get("geo")
+                print("\ndata")
+                print(data)
+                print("\nincludes")
+                print(includes)
+                print("\ngeo")
+                print(geo)
+                # break
+                # END DEBUGGING
+
+            # Skip deleted and status_withheld tweets
+            if "delete" in tweet or "status_withheld" in tweet:
+                skipped_tweets += 1
+                continue
+
+            # Collect statistics on the tweet.
+            with stage('extract'):
+                geo = extract_geo(tweet)
+            if geo.has_place:
+                has_place += 1
+            if geo.coordinates is not None:
+                has_coordinates += 1
+            if tweet.get('geo'):
+                has_geo += 1
+            if geo.profile_location:
+                has_profile_location += 1
+            mark = None
+            if progress is not None:
+                mark = (total_tweets, progress.position())
+            yield tweet, geo, line_number, mark
+
+    def resolve_chunk(chunk):
+        """Resolve a list of tuples from read_tweets(), and return a
+        list of ``(tweet, resolution, mark)`` triples."""
+        resolutions = []
+        if args.batch_size > 1:
+            # Issues found while resolving a batch cannot be attributed
+            # to single input lines.
+            diagnostics.line = None
+            for batch in chunks(chunk, args.batch_size):
+                with resolve_stage:
+                    resolutions.extend(resolver.resolve_batch(
+                        [tweet for tweet, _, _, _ in batch],
+                        [geo for _, geo, _, _ in batch]))
+        else:
+            for tweet, geo, line_number, _ in chunk:
+                diagnostics.line = line_number
+                with resolve_stage:
+                    resolutions.append(resolver.resolve_tweet(tweet, geo=geo))
+        return [(tweet, resolution, mark)
+                for (tweet, _, _, mark), resolution in zip(chunk, resolutions)]
+
+    with jsonlines.Writer(fo) as writer, installed(diagnostics):
+        if args.threads > 1:
+            resolved = imap_chunks(
+                resolve_chunk, read_tweets(), args.threads,
+                chunk_size=max(args.chunk_size, args.batch_size))
+        else:
+            resolved = (item for chunk in chunks(read_tweets(), args.batch_size)
+                        for item in resolve_chunk(chunk))
+        for tweet, resolution, mark in resolved:
+            finish(tweet, resolution, mark)
+    if progress is not None:
+        progress.close(total_tweets, resolved_tweets, resolution_method_counts)
     fi.close()
     fo.close()
+    if profiler is not None:
+        profiler.stop()
+        profiler.write_collapsed(args.profile_output)
 
+    if diagnostics:
+        source = args.input_file if isinstance(args.input_file, str) else '<stdin>'
+        diagnostics.write_summary(sys.stderr, source=source)
     if args.statistics:
-        # TODO: change the statistics to correspond with the new API v2
         print('Skipped %d tweets.' % skipped_tweets, file=sys.stderr)
         print('Tweets with "place" key: %d; '
                                        '"coordinates" key: %d; '
@@ -156,8 +333,28 @@ def main():
         print('Tweet resolution methods: %s.' % (
             ', '.join('%d by %s' % (v, k)
                 for (k, v) in resolution_method_counts.items())), file=sys.stderr)
+        if location_counts:
+            # Roll the known locations up to their countries.
+            registry = resolver.registry
+            country_counts = registry.hierarchy.rollup(
+                location_counts.keys(), 'country', location_counts.values())
+            print('Top countries: %s.' % (
+                ', '.join('%d in %s' % (count, registry[location_id].country)
+                    for location_id, count in country_counts.most_common(
+                        TOP_COUNTRIES))), file=sys.stderr)
+        for resolver_name, stats in resolver.stats.items():
+            print('Resolver %s: %d calls, %d skipped, %.1f%% hit rate, '
+                  '%.1f us/call.' % (
+                      resolver_name, stats.calls, stats.skipped,
+                      100 * stats.hit_rate, 1e6 * stats.cost), file=sys.stderr)
+        if args.embedded:
+            print('Resolved %d embedded tweets (%d cache hits, %d misses).' % (
+                embedded_resolved, embedded_resolver.hits,
+                embedded_resolver.misses), file=sys.stderr)
     print('Resolved locations for %d of %d tweets.' % (
         resolved_tweets, total_tweets), file=sys.stderr)
+    if times is not None:
+        times.write_summary(sys.stderr)
 
 
 if __name__ == '__main__':
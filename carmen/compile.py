@@ -0,0 +1,435 @@
+"""Compilation of location databases.
+
+Resolvers load locations from JSON lines files in the format of
+``carmen/data/locations.json``.  Such files are often assembled from
+several sources, and their problems only show up at run time: lines that
+cannot be parsed are skipped with a warning each time the database is
+loaded, and when several locations share an alias, the ``profile``
+resolver silently keeps whichever was loaded last.  This module checks
+and cleans a database once, at build time::
+
+    carmen compile-locations [options] input_path output_path
+
+or ``python -m carmen.compile``.  The input is either a location
+database in JSON lines format or a GeoNames dump (such as
+``allCountries.txt`` or ``cities1000.txt``), which is converted to
+countries, states (first-order administrative divisions), counties
+(second-order divisions) and cities.  Input is parsed and names are
+normalized in parallel chunks.  Then:
+
+*   aliases are normalized as the ``profile`` resolver normalizes
+    profile locations, and duplicates within a location are dropped;
+*   each alias shared by several locations is kept only by the
+    highest-ranked of them: the one with the highest ``priority`` field,
+    then the highest ``population`` field, and then the one appearing
+    last, which is the location the ``profile`` resolver would have
+    used;
+*   duplicate IDs, parent IDs that name no location, parent cycles, and
+    locations that share a full name (which the ``place`` resolver
+    cannot tell apart) are reported.
+
+The result is written as JSON lines, gzipped if the output path ends in
+``.gz``, and can be loaded with ``--locations`` or
+:py:meth:`.AbstractResolver.load_locations` like any other database.
+Everything found is written to a JSON report alongside it.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import functools
+import json
+import multiprocessing
+import os
+import sys
+
+from .io import open_file
+from .names import COUNTRY_CODES
+from .resolvers.profile import normalize
+
+
+GEONAMES_COLUMNS = (
+    'geonameid', 'name', 'asciiname', 'alternatenames', 'latitude',
+    'longitude', 'feature_class', 'feature_code', 'country_code', 'cc2',
+    'admin1_code', 'admin2_code', 'admin3_code', 'admin4_code',
+    'population', 'elevation', 'dem', 'timezone', 'modification_date')
+"""The columns of a GeoNames dump."""
+
+GEONAMES_LEVELS = {
+    'PCLI': 'country',
+    'PCLD': 'country',
+    'PCLF': 'country',
+    'PCLIX': 'country',
+    'PCLS': 'country',
+    'ADM1': 'state',
+    'ADM2': 'county',
+}
+"""Maps the GeoNames feature codes of administrative divisions to
+location levels.  Populated places (feature class ``P``) are cities."""
+
+MAX_ALIAS_LENGTH = 100
+
+
+def _parse_jsonl(line):
+    fields = json.loads(line)
+    if not isinstance(fields, dict):
+        raise ValueError('not a JSON object')
+    if 'id' not in fields:
+        raise ValueError('no id')
+    fields['id'] = int(fields['id'])
+    for key in ('latitude', 'longitude'):
+        if fields.get(key):
+            float(fields[key])
+    return fields
+
+
+def _parse_geonames(line, min_population):
+    values = line.rstrip('\r\n').split('\t')
+    if len(values) < len(GEONAMES_COLUMNS):
+        raise ValueError('expected %d columns, found %d' % (
+            len(GEONAMES_COLUMNS), len(values)))
+    row = dict(zip(GEONAMES_COLUMNS, values))
+    if row['feature_class'] == 'P':
+        level = 'city'
+    else:
+        level = GEONAMES_LEVELS.get(row['feature_code'])
+        if level is None:
+            return None
+    population = int(row['population'] or 0)
+    if level == 'city' and population < min_population:
+        return None
+    names = [row['name'], row['asciiname']]
+    names.extend(name for name in row['alternatenames'].split(',')
+                 if not name.startswith('http'))
+    return {
+        'id': int(row['geonameid']),
+        'level': level,
+        'name': row['name'],
+        'names': [name for name in names
+                  if name and len(name) <= MAX_ALIAS_LENGTH],
+        'latitude': row['latitude'],
+        'longitude': row['longitude'],
+        'countrycode': row['country_code'],
+        'admin1': row['admin1_code'],
+        'admin2': row['admin2_code'],
+        'population': population,
+    }
+
+
+def _parse_chunk(chunk, input_format='jsonl', min_population=0):
+    """Parse a list of ``(line_number, line)`` pairs, returning a list
+    of ``(line_number, record, error)`` triples for the lines that hold
+    records or errors.  Records from JSON lines input are locations;
+    records from GeoNames input are intermediate dictionaries.  The
+    normalized aliases of each record are added as ``_names``."""
+    results = []
+    for line_number, line in chunk:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            if input_format == 'geonames':
+                record = _parse_geonames(line, min_population)
+                if record is None:
+                    continue
+                names = record['names']
+            else:
+                record = _parse_jsonl(line)
+                names = record.get('aliases') or ()
+        except (ValueError, TypeError) as err:
+            results.append((line_number, None, str(err)))
+            continue
+        normalized = []
+        for name in names:
+            name = normalize(name)
+            if name and name not in normalized:
+                normalized.append(name)
+        record['_names'] = normalized
+        results.append((line_number, record, None))
+    return results
+
+
+def _chunks(lines, chunk_size):
+    chunk = []
+    for line_number, line in enumerate(lines):
+        chunk.append((line_number, line))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def read_records(path, input_format='jsonl', processes=None,
+                 chunk_size=10000, min_population=0):
+    """Parse the records in *path* in chunks of *chunk_size* lines using
+    *processes* worker processes (the number of CPUs if None; no
+    workers if 1), and yield ``(line_number, record, error)`` triples
+    in input order."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    parse = functools.partial(_parse_chunk, input_format=input_format,
+                              min_population=min_population)
+    with open_file(path, 'rb') as input:
+        if processes > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                for results in pool.imap(parse, _chunks(input, chunk_size)):
+                    for result in results:
+                        yield result
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for chunk in _chunks(input, chunk_size):
+                for result in parse(chunk):
+                    yield result
+
+
+def _country_name(countrycode, countries):
+    country = countries.get(countrycode)
+    if country is not None:
+        return country['name']
+    name = COUNTRY_CODES.get(countrycode.lower())
+    return name.title() if name else countrycode
+
+
+def geonames_locations(records):
+    """Convert GeoNames records from :py:func:`read_records` to
+    locations, linking each to the division containing it."""
+    countries, states, counties = {}, {}, {}
+    for record in records:
+        if record['level'] == 'country':
+            countries.setdefault(record['countrycode'], record)
+        elif record['level'] == 'state':
+            states.setdefault((record['countrycode'], record['admin1']), record)
+        elif record['level'] == 'county':
+            counties.setdefault((record['countrycode'], record['admin1'],
+                                 record['admin2']), record)
+    locations = []
+    for record in records:
+        level = record['level']
+        countrycode = record['countrycode']
+        country = _country_name(countrycode, countries)
+        state = states.get((countrycode, record['admin1']))
+        county = counties.get((countrycode, record['admin1'], record['admin2']))
+        location = {
+            'id': record['id'],
+            'country': country,
+            'countrycode': countrycode,
+            'latitude': record['latitude'],
+            'longitude': record['longitude'],
+            'population': record['population'],
+        }
+        # The divisions above this one, from the most specific.
+        parents = []
+        if level == 'city':
+            parents = [county, state, countries.get(countrycode)]
+        elif level == 'county':
+            parents = [state, countries.get(countrycode)]
+        elif level == 'state':
+            parents = [countries.get(countrycode)]
+        if level in ('city', 'county') and state is not None:
+            location['state'] = state['name']
+            if countrycode == 'US':
+                location['statecode'] = record['admin1']
+        elif level == 'state':
+            location['state'] = record['name']
+            if countrycode == 'US':
+                location['statecode'] = record['admin1']
+        if level == 'city' and county is not None:
+            location['county'] = county['name']
+        elif level == 'county':
+            location['county'] = record['name']
+        if level == 'city':
+            location['city'] = record['name']
+        parent = next((parent for parent in parents if parent is not None), None)
+        location['parent_id'] = parent['id'] if parent is not None else -1
+        names = list(record['_names'])
+        # Qualified names, as users often write them.
+        qualifiers = [location.get('state'), country] if level != 'country' else []
+        for qualifier in qualifiers:
+            if qualifier and qualifier != record['name']:
+                qualified = normalize('%s, %s' % (record['name'], qualifier))
+                if qualified not in names:
+                    names.append(qualified)
+        location['aliases'] = names
+        location['_names'] = names
+        locations.append(location)
+    return locations
+
+
+def _rank(location, position):
+    def number(value):
+        try:
+            return float(value or 0)
+        except (TypeError, ValueError):
+            return 0.0
+    return (number(location.get('priority')), number(location.get('population')),
+            position)
+
+
+def _full_name(location):
+    return tuple((location.get(level) or '').lower()
+                 for level in ('country', 'state', 'county', 'city'))
+
+
+def compile_locations(locations, report):
+    """Check and clean *locations*, a list of location dictionaries
+    with normalized aliases in ``_names``, recording problems in the
+    dictionary *report*, and return the cleaned locations in order."""
+    # Later duplicates of an ID replace earlier ones, as when loading.
+    by_id = collections.OrderedDict()
+    for location in locations:
+        if location['id'] in by_id:
+            report['duplicate_ids'].append(location['id'])
+            del by_id[location['id']]
+        by_id[location['id']] = location
+    locations = list(by_id.values())
+
+    claims = collections.defaultdict(list)
+    for position, location in enumerate(locations):
+        for name in location['_names']:
+            claims[name].append(position)
+    owners = {}
+    for name, positions in claims.items():
+        winner = max(positions, key=lambda i: _rank(locations[i], i))
+        owners[name] = winner
+        if len(positions) > 1:
+            report['alias_conflicts'].append({
+                'alias': name,
+                'kept_by': locations[winner]['id'],
+                'dropped_from': [locations[i]['id'] for i in positions
+                                 if i != winner]})
+    for position, location in enumerate(locations):
+        location['aliases'] = [name for name in location.pop('_names')
+                               if owners[name] == position]
+
+    for location in locations:
+        parent_id = int(location.get('parent_id') or -1)
+        location['parent_id'] = parent_id
+        if parent_id != -1 and parent_id not in by_id:
+            report['missing_parents'].append(
+                {'id': location['id'], 'parent_id': parent_id})
+    for location in locations:
+        # Walk up from each location, stopping after as many steps as
+        # there are locations.
+        seen = set()
+        current = location
+        while current is not None and current['id'] not in seen:
+            seen.add(current['id'])
+            current = by_id.get(current['parent_id'])
+        if current is location:
+            report['parent_cycles'].append(location['id'])
+
+    full_names = collections.defaultdict(list)
+    for location in locations:
+        full_names[_full_name(location)].append(location['id'])
+    for name, location_ids in full_names.items():
+        if len(location_ids) > 1:
+            report['duplicate_names'].append(
+                {'name': ', '.join(filter(None, reversed(name))),
+                 'ids': location_ids})
+    return locations
+
+
+def new_report():
+    return collections.OrderedDict((key, []) for key in (
+        'invalid_lines', 'duplicate_ids', 'alias_conflicts',
+        'missing_parents', 'parent_cycles', 'duplicate_names'))
+
+
+def write_locations(path, locations):
+    """Write *locations* to *path* as JSON lines, gzipped if *path* ends
+    in ``.gz``, replacing the file atomically."""
+    temporary = path + '.tmp' + ('.gz' if path.endswith('.gz') else '')
+    with open_file(temporary, 'wb') as output:
+        for location in locations:
+            output.write(json.dumps(location, sort_keys=True).encode('utf-8'))
+            output.write(b'\n')
+    os.replace(temporary, path)
+
+
+def compile_file(input_path, output_path, report_path=None,
+                 input_format='jsonl', processes=None, min_population=1000):
+    """Compile the locations in *input_path* to *output_path*, writing
+    the report to *report_path* (by default, the output path with
+    ``.report.json`` appended).  Return the report."""
+    report = new_report()
+    records = []
+    for line_number, record, error in read_records(
+            input_path, input_format=input_format, processes=processes,
+            min_population=min_population):
+        if record is None:
+            report['invalid_lines'].append(
+                {'line': line_number, 'error': error})
+        else:
+            records.append(record)
+    if input_format == 'geonames':
+        records = geonames_locations(records)
+    locations = compile_locations(records, report)
+    write_locations(output_path, locations)
+    report['summary'] = {
+        'locations': len(locations),
+        'aliases': sum(len(location['aliases']) for location in locations),
+    }
+    report['summary'].update((key, len(value)) for key, value in report.items()
+                             if key != 'summary')
+    if report_path is None:
+        report_path = output_path + '.report.json'
+    temporary = report_path + '.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(report, output, indent=2)
+        output.write('\n')
+    os.replace(temporary, report_path)
+    return report
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='carmen compile-locations',
+        description='Check, deduplicate and compile a location database.',
+        epilog='Paths ending in ".gz" are treated as gzipped files.')
+    parser.add_argument('input_file', metavar='input_path',
+        help='location database (JSON lines) or GeoNames dump')
+    parser.add_argument('output_file', metavar='output_path',
+        help='path to write the compiled database to')
+    parser.add_argument('--format', choices=('jsonl', 'geonames'),
+        help='input format (default: geonames for .txt files, otherwise '
+             'jsonl)')
+    parser.add_argument('--report', metavar='PATH', dest='report_file',
+        help='path to write the JSON report to (default: output_path '
+             'followed by .report.json)')
+    parser.add_argument('--min-population', metavar='N', type=int,
+        default=1000,
+        help='with GeoNames input, leave out cities with fewer people '
+             '(default: 1000)')
+    parser.add_argument('-p', '--processes', type=int,
+        help='number of worker processes (defaults to the number of CPUs)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    input_format = args.format
+    if input_format is None:
+        name = args.input_file[:-3] if args.input_file.endswith('.gz') else args.input_file
+        input_format = 'geonames' if name.endswith('.txt') else 'jsonl'
+    report = compile_file(
+        args.input_file, args.output_file, report_path=args.report_file,
+        input_format=input_format, processes=args.processes,
+        min_population=args.min_population)
+    summary = report['summary']
+    print('Compiled %d locations with %d aliases: %d invalid lines, %d '
+          'duplicate IDs, %d alias conflicts, %d missing parents, %d '
+          'parent cycles, %d duplicate names.' % (
+              summary['locations'], summary['aliases'],
+              summary['invalid_lines'], summary['duplicate_ids'],
+              summary['alias_conflicts'], summary['missing_parents'],
+              summary['parent_cycles'], summary['duplicate_names']),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
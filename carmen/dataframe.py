@@ -0,0 +1,291 @@
+"""Resolution of tweets held in columns of a pandas DataFrame or Arrow
+table.
+
+:py:func:`resolve_dataframe` runs each resolver of a resolver
+collection once per distinct combination of the column values that
+resolver reads (its :py:attr:`~.AbstractResolver.geo_fields`), rather
+than once per row, and resolvers with a bulk
+``resolve_coordinates`` method, such as ``geocode``, resolve all
+coordinates in one vectorized call.  Rows are never converted to
+tweets.  pandas (and, for Arrow tables, pyarrow) must be installed.
+"""
+
+from .extract import TweetGeo
+from .location import EARTH
+from .resolver import Resolution, known_resolvers
+
+
+DEFAULT_COLUMNS = {
+    'latitude': 'lat',
+    'longitude': 'lon',
+    'place_id': 'place_id',
+    'place_url': 'place_url',
+    'place_type': 'place_type',
+    'place_name': 'place_name',
+    'place_full_name': 'place_full_name',
+    'place_country': 'country',
+    'profile_location': 'user_location',
+    'time_zone': 'time_zone',
+    'utc_offset': 'utc_offset',
+}
+"""The default column names for each kind of tweet information, keyed
+by the names of :py:class:`.TweetGeo` fields (with ``latitude`` and
+``longitude`` in place of ``coordinates``)."""
+
+PLACE_FIELDS = ('place_id', 'place_url', 'place_type', 'place_name',
+                'place_full_name', 'place_country')
+
+LOCATION_COLUMNS = ('id', 'country', 'state', 'county', 'city',
+                    'latitude', 'longitude')
+"""The location attributes returned as columns, along with
+``resolution_method``, ``provisional`` and ``confidence``."""
+
+_EMPTY_GEO = TweetGeo(**dict.fromkeys(TweetGeo._fields))._replace(
+    apiv2=False, has_place=False)
+
+
+def _resolver_name(resolver):
+    """Return the name under which the class of *resolver* is
+    registered, or the class name if it is not registered."""
+    for name, class_ in known_resolvers.items():
+        if type(resolver) is class_:
+            return name
+    return type(resolver).__name__
+
+
+def _source_columns(geo_fields, columns):
+    """Return the input columns needed to fill in *geo_fields*."""
+    sources = []
+    for field in geo_fields:
+        if field == 'coordinates':
+            needed = ('latitude', 'longitude')
+        elif field == 'has_place':
+            needed = PLACE_FIELDS
+        else:
+            needed = (field,)
+        for name in needed:
+            if name in columns and columns[name] not in sources:
+                sources.append(columns[name])
+    return sources
+
+
+def _value(value):
+    import pandas as pd
+    if value is None or (not isinstance(value, (list, tuple, dict)) and
+                         pd.isna(value)):
+        return None
+    return value
+
+
+def _geo(values, columns):
+    """Return a :py:class:`.TweetGeo` record for one row, given as a
+    dictionary *values* of input column values."""
+    fields = {}
+    for field, column in columns.items():
+        if column in values:
+            fields[field] = _value(values[column])
+    latitude = fields.pop('latitude', None)
+    longitude = fields.pop('longitude', None)
+    if latitude is not None and longitude is not None:
+        fields['coordinates'] = (float(longitude), float(latitude))
+    if 'utc_offset' in fields and fields['utc_offset'] is not None:
+        fields['utc_offset'] = int(fields['utc_offset'])
+    fields['has_place'] = any(fields.get(field) is not None
+                              for field in PLACE_FIELDS)
+    return _EMPTY_GEO._replace(**fields)
+
+
+def _resolve_distinct(resolver, frame, rows, columns):
+    """Resolve the rows of *frame* at positions *rows* with *resolver*,
+    once per distinct combination of the values it reads.  Return an
+    array of indexes into a list of resolved locations (-1 for none),
+    arrays of provisional flags and confidences, and the list of
+    locations."""
+    import numpy as np
+    sources = _source_columns(resolver.geo_fields, columns)
+    indexes = np.full(len(rows), -1, dtype=np.int64)
+    provisional = np.zeros(len(rows), dtype=bool)
+    confidence = np.zeros(len(rows))
+    locations = []
+    if not sources or not len(rows):
+        return indexes, provisional, confidence, locations
+    subset = frame[sources].iloc[rows]
+    codes = subset.groupby(sources, dropna=False, sort=False).ngroup().to_numpy()
+    _, first_rows = np.unique(codes, return_index=True)
+    distinct = subset.iloc[first_rows]
+    code_indexes = np.full(len(first_rows), -1, dtype=np.int64)
+    code_provisional = np.zeros(len(first_rows), dtype=bool)
+    code_confidence = np.zeros(len(first_rows))
+    for code, values in enumerate(distinct.itertuples(index=False, name=None)):
+        resolution = Resolution.of(resolver.resolve_geo(
+            _geo(dict(zip(sources, values)), columns)))
+        if resolution:
+            code_provisional[code] = resolution.provisional
+            code_confidence[code] = resolution.confidence
+            code_indexes[code] = len(locations)
+            locations.append(resolution.location)
+    return (code_indexes[codes], code_provisional[codes],
+            code_confidence[codes], locations)
+
+
+def _resolve_coordinates(resolver, frame, rows, columns):
+    """Resolve the rows of *frame* at positions *rows* with the
+    resolver's bulk ``resolve_coordinates`` method, returning the same
+    as :py:func:`_resolve_distinct`."""
+    import numpy as np
+    indexes = np.full(len(rows), -1, dtype=np.int64)
+    provisional = np.zeros(len(rows), dtype=bool)
+    confidence = np.ones(len(rows))
+    if ('latitude' not in columns or 'longitude' not in columns or
+            not len(rows)):
+        return indexes, provisional, confidence, []
+    latitudes = frame[columns['latitude']].iloc[rows].to_numpy(dtype=float, na_value=np.nan)
+    longitudes = frame[columns['longitude']].iloc[rows].to_numpy(dtype=float, na_value=np.nan)
+    location_ids = resolver.resolve_coordinates(latitudes, longitudes)
+    if isinstance(location_ids, tuple):
+        # The ID of EARTH is -1, so only the distance tells whether a
+        # point was resolved.
+        location_ids, distances = location_ids
+        resolved = np.isfinite(distances)
+        distance_confidence = getattr(resolver, 'distance_confidence', None)
+        if distance_confidence is not None:
+            confidence = distance_confidence(distances)
+    else:
+        resolved = location_ids >= 0
+    resolved = np.flatnonzero(resolved)
+    unique_ids, inverse = np.unique(location_ids[resolved], return_inverse=True)
+    locations = []
+    unique_indexes = np.full(len(unique_ids), -1, dtype=np.int64)
+    for k, location_id in enumerate(unique_ids):
+        location = resolver.registry.get(int(location_id))
+        if location is None and location_id == EARTH.id:
+            location = EARTH
+        if location is not None:
+            unique_indexes[k] = len(locations)
+            locations.append(location)
+    indexes[resolved] = unique_indexes[inverse.ravel()]
+    return indexes, provisional, confidence, locations
+
+
+def resolve_dataframe(frame, resolver, columns=None):
+    """Resolve the tweets described by the rows of *frame*, a pandas
+    DataFrame or pyarrow Table, with *resolver* (usually a resolver
+    collection returned by :py:func:`.get_resolver`), and return a table
+    of the same kind with one row per input row.
+
+    *columns* maps kinds of tweet information to the names of the
+    columns holding them, overriding :py:data:`DEFAULT_COLUMNS`; columns
+    that are missing from *frame* are treated as empty.  The result has
+    the columns ``id``, ``country``, ``state``, ``county``, ``city``,
+    ``latitude`` and ``longitude`` of each row's location (missing if
+    unresolved), ``resolution_method``, ``provisional``, and
+    ``confidence``.  Its rows have the same index as *frame*.  When
+    *resolver* is a single resolver rather than a collection, the
+    ``resolution_method`` is the name it is registered under.
+
+    Resolvers are applied in order as by
+    :py:meth:`.ResolverCollection.resolve_tweet`, following the
+    collection's :py:class:`.ConfidencePolicy` if it has one, and each
+    only to the rows still without a final resolution.  Every resolver
+    must define ``resolve_geo`` and :py:attr:`~.AbstractResolver.geo_fields`.
+    Coordinates are resolved by ``resolve_coordinates`` where a
+    resolver provides it, which for ``geocode`` uses great-circle
+    rather than geodesic distances.
+    """
+    import numpy as np
+    import pandas as pd
+
+    arrow = False
+    if not isinstance(frame, pd.DataFrame):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            pa = None
+        if pa is None or not isinstance(frame, pa.Table):
+            raise TypeError('expected a pandas DataFrame or pyarrow Table')
+        arrow = True
+    mapping = dict(DEFAULT_COLUMNS)
+    mapping.update(columns or {})
+    names = frame.column_names if arrow else frame.columns
+    mapping = dict((field, column) for field, column in mapping.items()
+                   if column in names)
+    if arrow:
+        frame = frame.select(sorted(set(mapping.values()))).to_pandas()
+
+    resolvers = getattr(resolver, 'resolvers', None)
+    if resolvers is None:
+        resolvers = [(_resolver_name(resolver), resolver)]
+    for resolver_name, child in resolvers:
+        if getattr(child, 'resolve_coordinates', None) is None and (
+                child.resolve_geo is None or child.geo_fields is None):
+            raise ValueError('resolver "%s" cannot resolve columns' % resolver_name)
+
+    policy = getattr(resolver, 'policy', None)
+    num_rows = len(frame)
+    # Indexes into locations of each row's final and best provisional
+    # resolutions, and the resolvers that found them.
+    locations = []
+    final = np.full(num_rows, -1, dtype=np.int64)
+    final_method = np.full(num_rows, -1, dtype=np.int64)
+    final_provisional = np.zeros(num_rows, dtype=bool)
+    final_confidence = np.full(num_rows, np.nan)
+    fallback = np.full(num_rows, -1, dtype=np.int64)
+    fallback_method = np.full(num_rows, -1, dtype=np.int64)
+    fallback_confidence = np.full(num_rows, np.nan)
+    for method, (resolver_name, child) in enumerate(resolvers):
+        rows = np.flatnonzero(final < 0)
+        if not len(rows):
+            break
+        if getattr(child, 'resolve_coordinates', None) is not None:
+            indexes, provisional, confidence, found = _resolve_coordinates(
+                child, frame, rows, mapping)
+        else:
+            indexes, provisional, confidence, found = _resolve_distinct(
+                child, frame, rows, mapping)
+        resolved = indexes >= 0
+        indexes = np.where(resolved, indexes + len(locations), -1)
+        locations.extend(found)
+        accepted = ~provisional
+        if policy is not None:
+            # The same decisions as ConfidencePolicy.apply.
+            high = np.zeros(len(rows), dtype=bool)
+            if policy.accept is not None:
+                high = confidence >= policy.accept
+            if policy.minimum is not None:
+                provisional = provisional | (~high & (confidence < policy.minimum))
+            accepted = ~provisional | high
+        definite = resolved & accepted
+        final[rows[definite]] = indexes[definite]
+        final_method[rows[definite]] = method
+        final_provisional[rows[definite]] = provisional[definite]
+        final_confidence[rows[definite]] = confidence[definite]
+        tentative = resolved & ~accepted & (fallback[rows] < 0)
+        fallback[rows[tentative]] = indexes[tentative]
+        fallback_method[rows[tentative]] = method
+        fallback_confidence[rows[tentative]] = confidence[tentative]
+    is_fallback = (final < 0) & (fallback >= 0)
+    final = np.where(is_fallback, fallback, final)
+    final_method = np.where(is_fallback, fallback_method, final_method)
+    final_provisional = final_provisional | is_fallback
+    final_confidence = np.where(is_fallback, fallback_confidence, final_confidence)
+
+    # Look up each attribute once per location, and then take the
+    # values for every row at once; the extra last entry is for rows
+    # without a location.
+    result = {}
+    for attribute in LOCATION_COLUMNS:
+        values = [getattr(location, attribute) for location in locations]
+        if attribute in ('latitude', 'longitude'):
+            table = np.array(values + [np.nan], dtype=float)
+        else:
+            table = np.array(values + [None], dtype=object)
+        result[attribute] = table[final]
+    method_names = np.array([name for name, _ in resolvers] + [None], dtype=object)
+    result['resolution_method'] = method_names[final_method]
+    result['provisional'] = final_provisional
+    result['confidence'] = final_confidence
+    result = pd.DataFrame(result, index=frame.index)
+    result['id'] = result['id'].astype('Int64')
+    if arrow:
+        return pa.Table.from_pandas(result, preserve_index=False)
+    return result
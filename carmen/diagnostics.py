@@ -0,0 +1,102 @@
+"""Reporting of data-quality issues found while resolving tweets.
+
+Resolvers report problems with individual tweets, such as a Place with
+no country, through :py:func:`report`.  By default each report is
+issued as a warning.  Long-running frontends can instead install a
+:py:class:`Diagnostics` object, which counts reports by category and
+keeps only a few examples of each, so that dirty data costs little and
+does not flood standard error."""
+
+from __future__ import print_function
+
+import collections
+import contextlib
+import sys
+import threading
+import warnings
+
+
+class Diagnostics(object):
+    """Counts data-quality reports by category, keeping up to
+    *max_examples* example messages per category along with the input
+    line number that was being processed (see :py:attr:`line`)."""
+
+    def __init__(self, max_examples=5):
+        self.max_examples = max_examples
+        self.counts = collections.Counter()
+        self.examples = collections.defaultdict(list)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def line(self):
+        """The input line number being processed by the current thread,
+        recorded with example messages."""
+        return getattr(self._local, 'line', None)
+
+    @line.setter
+    def line(self, line):
+        self._local.line = line
+
+    def report(self, category, message):
+        """Count an issue of the given *category*, and keep *message*
+        as an example if fewer than *max_examples* have been kept.
+        Reports may be made from several threads at once."""
+        line = self.line
+        with self._lock:
+            self.counts[category] += 1
+            examples = self.examples[category]
+            if len(examples) < self.max_examples:
+                examples.append((line, message))
+
+    def showwarning(self, message, category, filename, lineno, file=None,
+                    line=None):
+        """A replacement for :py:func:`warnings.showwarning` that
+        records warnings as reports, categorized by warning class."""
+        self.report(category.__name__, str(message))
+
+    def __bool__(self):
+        return bool(self.counts)
+
+    __nonzero__ = __bool__
+
+    def write_summary(self, file=sys.stderr, source=None):
+        """Write the number of reports in each category, with examples,
+        to *file*.  *source* names the input for example locations."""
+        for category, count in self.counts.most_common():
+            print('%d data-quality issue(s) of type %s, e.g.:' % (
+                count, category), file=file)
+            for line, message in self.examples[category]:
+                if line is None:
+                    print('  %s' % message, file=file)
+                else:
+                    print('  %s:%d: %s' % (source or '<input>', line, message),
+                          file=file)
+
+
+_active = None
+
+
+def report(category, message):
+    """Report a data-quality issue of the given *category* to the
+    installed :py:class:`Diagnostics` object, or issue *message* as a
+    warning if none is installed."""
+    diagnostics = _active
+    if diagnostics is None:
+        warnings.warn(message, stacklevel=2)
+    else:
+        diagnostics.report(category, message)
+
+
+@contextlib.contextmanager
+def installed(diagnostics):
+    """Return a context manager that makes *diagnostics* receive all
+    reports, and any warnings issued, until the context is exited."""
+    global _active
+    previous = (_active, warnings.showwarning)
+    _active = diagnostics
+    warnings.showwarning = diagnostics.showwarning
+    try:
+        yield diagnostics
+    finally:
+        _active, warnings.showwarning = previous
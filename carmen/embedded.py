@@ -0,0 +1,137 @@
+"""Resolution of the tweets embedded in retweets and quoted tweets.
+
+A retweet or quoted tweet carries a copy of the original tweet: in
+version 1.1 of the Twitter API under ``retweeted_status`` and
+``quoted_status``, and in version 2 as an entry in ``includes.tweets``
+named by ``data.referenced_tweets``.  Popular tweets are retweeted many
+times over, so :py:class:`EmbeddedResolver` caches the resolution of
+each original by its tweet ID, keeping a bounded number of the most
+recently used."""
+
+import collections
+import threading
+
+from .extract import extract_geo
+
+
+V1_EMBEDDED_KEYS = ('retweeted_status', 'quoted_status')
+"""The keys of version 1.1 tweets that hold embedded tweets."""
+
+
+def _v1_id(tweet):
+    tweet_id = tweet.get('id_str')
+    if tweet_id is None:
+        tweet_id = tweet.get('id')
+    return None if tweet_id is None else str(tweet_id)
+
+
+def embedded_tweets(tweet):
+    """Yield a ``(tweet_id, target, embedded)`` triple for each tweet
+    embedded in *tweet*.  *tweet_id* is the embedded tweet's ID as a
+    string, *target* is the nested object to annotate with its
+    location, and *embedded* is the embedded tweet in a form that
+    resolvers accept.  Each distinct embedded tweet is yielded once."""
+    data = tweet.get('data')
+    if data is None:
+        # API v1: embedded tweets are complete tweet objects, and may
+        # themselves embed a quoted tweet.
+        seen = set()
+        pending = [tweet]
+        while pending:
+            current = pending.pop()
+            for key in V1_EMBEDDED_KEYS:
+                embedded = current.get(key)
+                if not isinstance(embedded, dict):
+                    continue
+                tweet_id = _v1_id(embedded)
+                if tweet_id is None or tweet_id in seen:
+                    continue
+                seen.add(tweet_id)
+                yield tweet_id, embedded, embedded
+                pending.append(embedded)
+        return
+    # API v2: referenced tweets are in the expansions, and share the
+    # tweet's Places and users.  Each is given only the Place it names
+    # itself, since extract_geo would otherwise take the first Place,
+    # which may be the referencing tweet's.
+    if isinstance(data, list):
+        data = data[0] if data else {}
+    includes = tweet.get('includes') or {}
+    included = includes.get('tweets')
+    if not included:
+        return
+    referenced_ids = set(
+        str(reference.get('id')) for reference in data.get('referenced_tweets') or ()
+        if reference.get('type') in ('retweeted', 'quoted'))
+    for embedded in included:
+        tweet_id = embedded.get('id')
+        if tweet_id is None:
+            continue
+        tweet_id = str(tweet_id)
+        if tweet_id in referenced_ids:
+            referenced_ids.discard(tweet_id)
+            place_id = (embedded.get('geo') or {}).get('place_id')
+            places = [place for place in includes.get('places') or ()
+                      if place_id is not None and place.get('id') == place_id]
+            yield tweet_id, embedded, {
+                'data': embedded, 'includes': dict(includes, places=places)}
+
+
+class EmbeddedResolver(object):
+    """Resolves the tweets embedded in tweets with *resolver*, caching
+    up to *cache_size* resolutions by original tweet ID.  The cache is
+    safe to share between threads."""
+
+    def __init__(self, resolver, cache_size=100000):
+        self.resolver = resolver
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cached(self, tweet_id):
+        with self._lock:
+            try:
+                resolution = self._cache.pop(tweet_id)
+            except KeyError:
+                self.misses += 1
+                raise
+            self._cache[tweet_id] = resolution
+            self.hits += 1
+            return resolution
+
+    def _store(self, tweet_id, resolution):
+        with self._lock:
+            self._cache[tweet_id] = resolution
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def resolve(self, tweet_id, embedded):
+        """Return the resolution of the embedded tweet *embedded* with
+        ID *tweet_id*, from the cache if possible."""
+        try:
+            return self._cached(tweet_id)
+        except KeyError:
+            pass
+        resolution = self.resolver.resolve_tweet(
+            embedded, geo=extract_geo(embedded))
+        self._store(tweet_id, resolution)
+        return resolution
+
+    def annotate(self, tweet):
+        """Resolve each tweet embedded in *tweet*, and set the
+        ``location`` key of each nested object whose location was
+        resolved to the :py:class:`.Resolution`.  Return the number of embedded tweets resolved."""
+        resolved = 0
+        for tweet_id, target, embedded in embedded_tweets(tweet):
+            resolution = self.resolve(tweet_id, embedded)
+            if resolution:
+                target['location'] = resolution
+                resolved += 1
+        return resolved
+
+    def clear(self):
+        """Empty the cache."""
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,379 @@
+"""Evaluate tweet locations resolved by one resolver against reference
+locations resolved by another.
+
+The two inputs are files of geolocated tweets as written by
+:py:mod:`carmen.cli`, for example one resolved with the ``profile``
+resolver and one with the ``place`` and ``geocode`` resolvers.  Tweets
+are matched by ID rather than by line position, so the files need not
+be in the same order or contain the same tweets.
+
+Usage::
+
+    python -m carmen.evaluation [options] predicted_path reference_path
+
+Evaluation streams both files (which may be gzipped) in two passes.
+The first pass extracts a compact record from each tweet, parsing only
+its ID and ``location`` field, and partitions the records into shards
+by tweet ID.  The second pass joins each shard and counts matches.
+Both passes are spread over worker processes, and the counts from each
+worker are merged at the end.
+"""
+from __future__ import print_function
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+import zlib
+
+from .io import open_file
+
+
+LEVELS = ('city', 'county', 'state', 'country')
+"""The administrative levels that are evaluated, most specific first."""
+
+ALL_RESOLVERS = 'all'
+"""The resolver name under which counts for every resolver are kept."""
+
+LOCATION_KEY = '"location": {'
+ID_STR_RE = re.compile(r'"id_str":\s*"(\d+)"')
+ID_RE = re.compile(r'"id":\s*"?(\d+)')
+# Strings, which may contain brackets, and the brackets that nest.
+TOKEN_RE = re.compile(r'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+_decoder = json.JSONDecoder()
+
+
+class EvaluationCounts(object):
+    """Mergeable counts of evaluated tweets.
+
+    Counts are kept per resolver (the ``resolution_method`` of the
+    predicted location, plus :py:data:`ALL_RESOLVERS`) and, for the
+    true, predicted and correct counts, per level."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def add(self, true_location, predicted_location, resolver):
+        """Count one tweet with reference location *true_location* and
+        *predicted_location* (None if unresolved), both given as tuples
+        of names in :py:data:`LEVELS` order."""
+        self.counts[ALL_RESOLVERS, 'locations'] += 1
+        if predicted_location is None:
+            return
+        for resolver_name in (ALL_RESOLVERS, resolver):
+            self.counts[resolver_name, 'resolved'] += 1
+            for level, true_name, predicted_name in zip(
+                    LEVELS, true_location, predicted_location):
+                if true_name is None:
+                    continue
+                self.counts[resolver_name, level, 'true'] += 1
+                if predicted_name is not None:
+                    self.counts[resolver_name, level, 'predicted'] += 1
+                    if predicted_name == true_name:
+                        self.counts[resolver_name, level, 'correct'] += 1
+
+    def merge(self, other):
+        """Add the counts from *other* to these counts."""
+        self.counts.update(other.counts)
+        return self
+
+    def resolvers(self):
+        """Return the names of the resolvers that resolved any tweets,
+        with :py:data:`ALL_RESOLVERS` first."""
+        names = set(key[0] for key in self.counts if key[1] == 'resolved')
+        names.discard(ALL_RESOLVERS)
+        return [ALL_RESOLVERS] + sorted(names)
+
+    def metrics(self, resolver=ALL_RESOLVERS):
+        """Return a dictionary of accuracy, precision and coverage for
+        each level, as ``(numerator, denominator)`` pairs, for tweets
+        resolved by *resolver*."""
+        counts = self.counts
+        metrics = {}
+        for level in LEVELS:
+            true = counts[resolver, level, 'true']
+            predicted = counts[resolver, level, 'predicted']
+            correct = counts[resolver, level, 'correct']
+            metrics[level] = {
+                'accuracy': (correct, true),
+                'precision': (correct, predicted),
+                'coverage': (predicted, true),
+            }
+        metrics['resolved'] = (counts[resolver, 'resolved'],
+                               counts[ALL_RESOLVERS, 'locations'])
+        return metrics
+
+
+def _ratio(numerator, denominator):
+    if not denominator:
+        return None
+    return 100.0 * numerator / denominator
+
+
+def _format_ratio(pair):
+    numerator, denominator = pair
+    ratio = _ratio(numerator, denominator)
+    return '%d / %d (%s)' % (
+        numerator, denominator, 'n/a' if ratio is None else '%.2f%%' % ratio)
+
+
+def format_report(counts, missing_ids=0):
+    """Return a human-readable report of *counts*."""
+    lines = ['(ACC = accuracy, PRC = precision, COV = coverage)']
+    for resolver in counts.resolvers():
+        metrics = counts.metrics(resolver)
+        lines.append('')
+        lines.append('==== %s ====' % resolver)
+        for name, key in (('ACC', 'accuracy'), ('PRC', 'precision'),
+                          ('COV', 'coverage')):
+            for level in LEVELS:
+                lines.append('%-9s %s: %s' % (
+                    level.upper(), name, _format_ratio(metrics[level][key])))
+        lines.append('resolved / locations: %s' % _format_ratio(metrics['resolved']))
+    if missing_ids:
+        lines.append('')
+        lines.append('Skipped %d tweets without an ID.' % missing_ids)
+    return '\n'.join(lines)
+
+
+def report_json(counts, missing_ids=0):
+    """Return the metrics in *counts* as a JSON-serializable
+    dictionary, with ratios as percentages (None when undefined)."""
+    output = {'missing_ids': missing_ids, 'resolvers': {}}
+    for resolver in counts.resolvers():
+        metrics = counts.metrics(resolver)
+        resolver_output = {'resolved': list(metrics['resolved'])}
+        for level in LEVELS:
+            resolver_output[level] = dict(
+                (key, {'count': list(pair), 'percent': _ratio(*pair)})
+                for key, pair in metrics[level].items())
+        output['resolvers'][resolver] = resolver_output
+    return output
+
+
+def _top_level_match(line, pattern):
+    """Return the first match of *pattern* in the JSON object *line*
+    that starts a key of that object itself rather than of an object
+    nested in it, or None."""
+    match = pattern.search(line)
+    if match is None:
+        return None
+    start = match.start()
+    if (line.count('{', 0, start) == 1 and line.count('[', 0, start) == 0
+            and line.count('}', 0, start) == 0):
+        # Nothing but the tweet itself opens before the match.
+        return match
+    depth = position = 0
+    for match in pattern.finditer(line):
+        for token in TOKEN_RE.finditer(line, position, match.start()):
+            token = token.group()
+            if token == '{' or token == '[':
+                depth += 1
+            elif token == '}' or token == ']':
+                depth -= 1
+        position = match.start()
+        if depth == 1:
+            return match
+    return None
+
+
+def _tweet_id(tweet):
+    tweet_id = tweet.get('id_str') or tweet.get('id')
+    if tweet_id is None and isinstance(tweet.get('data'), dict):
+        # An APIv2 tweet.
+        tweet_id = tweet['data'].get('id')
+    return str(tweet_id) if tweet_id is not None else None
+
+
+def extract_record(line):
+    """Return a ``(tweet_id, location, resolver)`` triple for one line
+    of geolocated output, parsing only what is needed.  *location* is a
+    tuple of names in :py:data:`LEVELS` order, or None if the tweet was
+    not resolved; *tweet_id* is None if no ID could be found.  Only the
+    tweet's own ID and location are used, never those of the tweets it
+    quotes or retweets."""
+    if isinstance(line, bytes):
+        line = line.decode('utf-8')
+    line = line.strip()
+    if not line:
+        return None, None, None
+    if line[0] == '"':
+        # carmen.cli writes each tweet as a JSON-encoded string.
+        line = json.loads(line)
+    match = _top_level_match(line, ID_STR_RE) or _top_level_match(line, ID_RE)
+    tweet_id = match.group(1) if match else None
+    # carmen.cli adds the location last, so the tweet's own location is
+    # the last "location" object in the line and is followed only by
+    # the brace closing the tweet; a user's profile location is a
+    # string instead.  Anything else, such as a location added to an
+    # embedded tweet by --embedded, calls for parsing the whole line.
+    start = line.rfind(LOCATION_KEY)
+    while start > 0 and line[start - 1] == '\\':
+        start = line.rfind(LOCATION_KEY, 0, start)
+    location = None
+    parsed = tweet_id is not None
+    if start >= 0:
+        try:
+            location, end = _decoder.raw_decode(
+                line, start + len(LOCATION_KEY) - 1)
+        except ValueError:
+            parsed = False
+        else:
+            parsed = parsed and line[end:].strip() == '}'
+    if not parsed:
+        try:
+            tweet = json.loads(line)
+        except ValueError:
+            return tweet_id, None, None
+        if not isinstance(tweet, dict):
+            return None, None, None
+        tweet_id = _tweet_id(tweet)
+        location = tweet.get('location')
+    if not isinstance(location, dict):
+        return tweet_id, None, None
+    return (tweet_id,
+            tuple(location.get(level) for level in LEVELS),
+            location.get('resolution_method'))
+
+
+def _extract_lines(lines):
+    return [extract_record(line) for line in lines]
+
+
+def _shard_of(tweet_id, num_shards):
+    return zlib.crc32(tweet_id.encode('ascii')) % num_shards
+
+
+def partition(path, directory, prefix, num_shards, pool, batch_size=10000):
+    """Extract records from the tweets in *path* and write them to
+    *num_shards* files in *directory*, named after *prefix*.  Return
+    the number of tweets without an ID."""
+    shards = [open(os.path.join(directory, '%s-%d' % (prefix, i)), 'w')
+              for i in range(num_shards)]
+    missing_ids = 0
+
+    def batches():
+        with open_file(path, 'rb') as input:
+            batch = []
+            for line in input:
+                batch.append(line)
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+            if batch:
+                yield batch
+
+    if pool is None:
+        extracted = map(_extract_lines, batches())
+    else:
+        extracted = pool.imap_unordered(_extract_lines, batches())
+    try:
+        for records in extracted:
+            for tweet_id, location, resolver in records:
+                if tweet_id is None:
+                    if location is not None or resolver is not None:
+                        missing_ids += 1
+                    continue
+                shards[_shard_of(tweet_id, num_shards)].write(
+                    json.dumps([tweet_id, location, resolver]) + '\n')
+    finally:
+        for shard in shards:
+            shard.close()
+    return missing_ids
+
+
+def evaluate_shard(predicted_path, reference_path):
+    """Join one shard of predicted and reference records by tweet ID,
+    and return their :py:class:`EvaluationCounts`."""
+    predicted = {}
+    with open(predicted_path) as input:
+        for line in input:
+            tweet_id, location, resolver = json.loads(line)
+            predicted[tweet_id] = (location, resolver)
+    counts = EvaluationCounts()
+    with open(reference_path) as input:
+        for line in input:
+            tweet_id, location, _ = json.loads(line)
+            if location is None:
+                continue
+            predicted_location, resolver = predicted.get(tweet_id, (None, None))
+            counts.add(location, predicted_location, resolver or 'unknown')
+    return counts
+
+
+def _evaluate_shard(paths):
+    return evaluate_shard(*paths)
+
+
+def evaluate(predicted_path, reference_path, processes=None, num_shards=16):
+    """Evaluate the locations in *predicted_path* against those in
+    *reference_path*, using *processes* worker processes (the number of
+    CPUs if None; no workers if 1).  Return a pair of the merged
+    :py:class:`EvaluationCounts` and the number of resolved tweets that
+    had no ID and were skipped."""
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(processes) if processes > 1 else None
+    directory = tempfile.mkdtemp(prefix='carmen-evaluation-')
+    try:
+        missing_ids = partition(predicted_path, directory, 'predicted',
+                                num_shards, pool)
+        missing_ids += partition(reference_path, directory, 'reference',
+                                 num_shards, pool)
+        shard_paths = [
+            (os.path.join(directory, 'predicted-%d' % i),
+             os.path.join(directory, 'reference-%d' % i))
+            for i in range(num_shards)]
+        if pool is None:
+            shard_counts = map(_evaluate_shard, shard_paths)
+        else:
+            shard_counts = pool.imap_unordered(_evaluate_shard, shard_paths)
+        counts = EvaluationCounts()
+        for partial_counts in shard_counts:
+            counts.merge(partial_counts)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+        shutil.rmtree(directory, ignore_errors=True)
+    return counts, missing_ids
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Evaluate resolved tweet locations against reference '
+                    'locations, matching tweets by ID.',
+        epilog='Paths ending in ".gz" are treated as gzipped files.')
+    parser.add_argument('predicted_file', metavar='predicted_path',
+        help='geolocated tweets to evaluate (e.g. resolved from profiles)')
+    parser.add_argument('reference_file', metavar='reference_path',
+        help='geolocated tweets with reference locations (e.g. resolved '
+             'from places and coordinates)')
+    parser.add_argument('-p', '--processes', type=int,
+        help='number of worker processes (defaults to the number of CPUs)')
+    parser.add_argument('--shards', type=int, default=16,
+        help='number of shards to partition tweets into (default: 16)')
+    parser.add_argument('--json', action='store_true',
+        help='print the metrics as JSON')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    counts, missing_ids = evaluate(
+        args.predicted_file, args.reference_file,
+        processes=args.processes, num_shards=args.shards)
+    if args.json:
+        json.dump(report_json(counts, missing_ids), sys.stdout, indent=2)
+        print()
+    else:
+        print(format_report(counts, missing_ids))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Extraction of the geographic information in a tweet.
+
+Tweets from version 1.1 and version 2 of the Twitter API store
+coordinates, Places and user profiles in different ways.
+:py:func:`extract_geo` reads all of them once per tweet into a compact
+:py:class:`TweetGeo` record, which the built-in resolvers consume
+instead of walking the tweet themselves."""
+
+from collections import namedtuple
+
+
+_TWEET_GEO_FIELDS = (
+    'apiv2',
+    'coordinates',
+    'bbox',
+    'has_place',
+    'place_id',
+    'place_url',
+    'place_type',
+    'place_name',
+    'place_full_name',
+    'place_country',
+    'profile_location',
+    'time_zone',
+    'utc_offset',
+)
+
+
+class TweetGeo(namedtuple('TweetGeo', _TWEET_GEO_FIELDS)):
+    """The geographic information in a tweet.
+
+    *coordinates* is the tweet's exact ``(longitude, latitude)`` pair,
+    and *bbox* is the ``(west, south, east, north)`` bounding box of its
+    Place; either may be None.  *has_place* is True if the tweet has a
+    Place, whose remaining fields (from the Place's ``id``, ``url``,
+    ``place_type``, ``name``, ``full_name`` and ``country``) are None
+    where missing.  *profile_location*, *time_zone* and *utc_offset*
+    (in seconds) come from the author's profile."""
+
+    __slots__ = ()
+
+    @property
+    def point(self):
+        """The tweet's exact coordinates if it has them, otherwise the
+        center of its Place's bounding box, as a ``(longitude,
+        latitude)`` pair; None if neither is available."""
+        if self.coordinates is not None:
+            return self.coordinates
+        bbox = self.bbox
+        if bbox is None:
+            return None
+        return (round((bbox[0] + bbox[2]) / 2, 7),
+                round((bbox[1] + bbox[3]) / 2, 7))
+
+
+def _coordinates(geometry):
+    # The Twitter API allows coordinate objects to both be absent and
+    # None, such that the key exists but has a None value.
+    coordinates = (geometry or {}).get('coordinates')
+    if not coordinates:
+        return None
+    return (float(coordinates[0]), float(coordinates[1]))
+
+
+def _v1_bbox(place):
+    # place->bounding_box->coordinates->[0] is a list of (long, lat)
+    # pairs around the Place.
+    polygons = (place.get('bounding_box') or {}).get('coordinates')
+    if not polygons or not polygons[0]:
+        return None
+    longitudes = [float(point[0]) for point in polygons[0]]
+    latitudes = [float(point[1]) for point in polygons[0]]
+    return (min(longitudes), min(latitudes), max(longitudes), max(latitudes))
+
+
+def _v2_bbox(place):
+    bbox = (place.get('geo') or {}).get('bbox')
+    if not bbox:
+        return None
+    return tuple(float(value) for value in bbox[:4])
+
+
+def _v2_place(includes, place_id):
+    places = includes.get('places')
+    if not places:
+        return None
+    # Prefer the Place the tweet refers to, since the expansions may
+    # include Places for other tweets.
+    if place_id is not None:
+        for place in places:
+            if place.get('id') == place_id:
+                return place
+    return places[0]
+
+
+def _v2_user(includes, author_id):
+    users = includes.get('users')
+    if not users:
+        return None
+    for user in users:
+        if user.get('id') == author_id:
+            return user
+    return None
+
+
+def _utc_offset(user):
+    utc_offset = user.get('utc_offset')
+    if utc_offset is None:
+        return None
+    try:
+        return int(utc_offset)
+    except (TypeError, ValueError):
+        return None
+
+
+def extract_geo(tweet):
+    """Return a :py:class:`TweetGeo` record of the geographic
+    information in *tweet*, a deserialized tweet from either version
+    1.1 or version 2 of the Twitter API."""
+    data = tweet.get('data')
+    if data is None:
+        # API v1
+        apiv2 = False
+        coordinates = _coordinates(tweet.get('coordinates'))
+        place = tweet.get('place') or None
+        user = tweet.get('user') or {}
+    else:
+        # API v2: the coordinates are in data->geo->coordinates, and
+        # Places and users are in the expansions in includes.
+        apiv2 = True
+        if isinstance(data, list):
+            data = data[0]  # Jack 12/12/22: it seems the API changed again. Now actual data is dict in a list
+        geo = data.get('geo') or {}
+        coordinates = _coordinates(geo.get('coordinates'))
+        includes = tweet.get('includes') or {}
+        place = _v2_place(includes, geo.get('place_id'))
+        user = _v2_user(includes, data.get('author_id')) or {}
+    if place:
+        return TweetGeo(
+            apiv2=apiv2, coordinates=coordinates,
+            bbox=_v2_bbox(place) if apiv2 else _v1_bbox(place),
+            has_place=True,
+            place_id=place.get('id'), place_url=place.get('url'),
+            place_type=place.get('place_type'), place_name=place.get('name'),
+            place_full_name=place.get('full_name'),
+            place_country=place.get('country'),
+            profile_location=user.get('location') or None,
+            time_zone=user.get('time_zone') or None,
+            utc_offset=_utc_offset(user))
+    return TweetGeo(
+        apiv2=apiv2, coordinates=coordinates, bbox=None, has_place=False,
+        place_id=None, place_url=None, place_type=None, place_name=None,
+        place_full_name=None, place_country=None,
+        profile_location=user.get('location') or None,
+        time_zone=user.get('time_zone') or None,
+        utc_offset=_utc_offset(user))
+
+
+def extract_geo_batch(tweets):
+    """Return a list of :py:class:`TweetGeo` records for *tweets*.
+
+    Each tweet is extracted separately by :py:func:`extract_geo`:
+    walking nested dictionaries does not vectorize, and tweets in a
+    batch share no work until their records are compared.  Work is
+    shared across a batch afterwards, by
+    :py:meth:`.ResolverCollection.resolve_batch`, which resolves each
+    distinct record once."""
+    return [extract_geo(tweet) for tweet in tweets]
@@ -0,0 +1,134 @@
+"""Approximate string matching for location names.
+
+:py:class:`DeletionIndex` finds the known name closest to a query
+within a small edit distance without comparing the query against every
+name.  Following the SymSpell algorithm, it stores each name under all
+the strings that can be made by deleting up to *max_distance*
+characters from its first *prefix_length* characters.  Two strings
+within edit distance *d* of each other always share such a deletion,
+so a lookup only generates the deletions of the query, probes the
+index for each, and checks the true distance of the few names found.
+"""
+
+from itertools import combinations
+
+
+ENTRY_BYTES = 120
+"""An estimate of the memory used by one index entry, in bytes."""
+
+
+def edit_distance(a, b, max_distance):
+    """Return the optimal string alignment distance (Levenshtein
+    distance, counting transpositions of adjacent characters as single
+    edits) between *a* and *b*, or ``max_distance + 1`` if it is
+    greater than *max_distance*."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_minimum = i
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1,
+                        previous[j - 1] + cost)
+            if (i > 1 and j > 1 and a[i - 1] == b[j - 2] and
+                    a[i - 2] == b[j - 1]):
+                value = min(value, previous_previous[j - 2] + 1)
+            current[j] = value
+            if value < row_minimum:
+                row_minimum = value
+        if row_minimum > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    distance = previous[len(b)]
+    return distance if distance <= max_distance else max_distance + 1
+
+
+def _deletions(term, max_distance):
+    """Return the set of strings made by deleting up to *max_distance*
+    characters from *term*, including *term* itself."""
+    deletions = set([term])
+    for count in range(1, min(max_distance, len(term)) + 1):
+        for positions in combinations(range(len(term)), count):
+            deletions.add(''.join(
+                character for i, character in enumerate(term)
+                if i not in positions))
+    return deletions
+
+
+def _binomial(n, k):
+    result = 1
+    for i in range(1, k + 1):
+        result = result * (n - k + i) // i
+    return result
+
+
+def estimate_entries(terms, max_distance, prefix_length):
+    """Return an upper bound on the number of index entries needed to
+    index *terms* with the given parameters."""
+    entries = 0
+    for term in terms:
+        length = min(len(term), prefix_length)
+        entries += sum(_binomial(length, k)
+                       for k in range(min(max_distance, length) + 1))
+    return entries
+
+
+class DeletionIndex(object):
+    """An index of *terms* for approximate lookup within
+    *max_distance* edits.  Deletions are generated from the first
+    *prefix_length* characters of each term, which bounds the size of
+    the index for long terms at the cost of more candidates to check.
+
+    If *memory_budget* (in bytes) is given, the prefix length is
+    reduced, no further than ``max_distance + 1``, until the estimated
+    size of the index fits within it."""
+
+    def __init__(self, terms, max_distance=2, prefix_length=7,
+                 memory_budget=None):
+        self.max_distance = max_distance
+        terms = list(terms)
+        if memory_budget is not None:
+            while (prefix_length > max_distance + 1 and
+                   ENTRY_BYTES * estimate_entries(
+                       terms, max_distance, prefix_length) > memory_budget):
+                prefix_length -= 1
+        self.prefix_length = prefix_length
+        self._terms = terms
+        self._deletions = {}
+        for rank, term in enumerate(terms):
+            for deletion in _deletions(term[:prefix_length], max_distance):
+                self._deletions.setdefault(deletion, []).append(rank)
+
+    def __len__(self):
+        return len(self._deletions)
+
+    def estimated_size(self):
+        """Return the estimated memory used by the index, in bytes."""
+        return ENTRY_BYTES * len(self._deletions)
+
+    def lookup(self, query):
+        """Return a ``(term, distance)`` pair for the indexed term
+        closest to *query*, or None if no term is within
+        *max_distance* edits.  Ties are broken in favour of the term
+        indexed first."""
+        max_distance = self.max_distance
+        best_rank, best_distance = None, max_distance + 1
+        checked = set()
+        for deletion in _deletions(query[:self.prefix_length], max_distance):
+            for rank in self._deletions.get(deletion, ()):
+                if rank in checked:
+                    continue
+                checked.add(rank)
+                distance = edit_distance(query, self._terms[rank],
+                                         min(best_distance, max_distance))
+                if distance > max_distance:
+                    continue
+                if (distance < best_distance or
+                        (distance == best_distance and rank < best_rank)):
+                    best_rank, best_distance = rank, distance
+        if best_rank is None:
+            return None
+        return self._terms[best_rank], best_distance
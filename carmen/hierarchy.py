@@ -0,0 +1,197 @@
+"""An index of the parent-child relationships between known locations.
+
+Each location in the database names its parent by ``parent_id``: a city
+its county or state, a county its state, and a state its country.
+:py:class:`LocationHierarchy` numbers the locations of a
+:py:class:`.LocationRegistry` and stores the hierarchy in flat integer
+arrays:
+
+*   the position of each location's parent (-1 for none);
+*   the children of each location, grouped by parent, with the offset of
+    each location's group (the compressed sparse row layout);
+*   the administrative level of each location.
+
+Walking up from a location therefore takes one array lookup per level,
+and nothing is allocated but the IDs returned.  The ancestor of every
+location at a given level is computed in one pass the first time it is
+asked for, after which counts can be rolled up to states or countries
+with a single lookup per item.
+
+Parent IDs that name no known location are treated as -1, and no walk
+takes more steps than there are locations, so malformed databases
+(which ``carmen compile-locations`` reports) cannot cause endless
+loops.
+
+A registry builds its hierarchy when first asked for it
+(:py:attr:`.LocationRegistry.hierarchy`), and shares it with every
+resolver using the registry."""
+
+import collections
+from array import array
+
+from .location import LEVELS
+
+
+_NO_LEVEL = len(LEVELS)
+
+
+class LocationHierarchy(object):
+    """The hierarchy of the locations in *registry*, a
+    :py:class:`.LocationRegistry`.  Locations are identified by their
+    IDs; methods given an unknown ID raise :py:exc:`KeyError`."""
+
+    def __init__(self, registry):
+        ids = array('q', sorted(registry.ids()))
+        index = dict((location_id, i) for i, location_id in enumerate(ids))
+        parents = array('q', [-1]) * len(ids)
+        levels = bytearray(len(ids))
+        for i, location_id in enumerate(ids):
+            location = registry[location_id]
+            parent = index.get(location.parent_id, -1)
+            if parent != i:
+                parents[i] = parent
+            level = location.level()
+            levels[i] = LEVELS.index(level) if level else _NO_LEVEL
+        # Count each location's children, turn the counts into offsets,
+        # and then fill in the groups.
+        offsets = array('q', [0]) * (len(ids) + 1)
+        for parent in parents:
+            if parent >= 0:
+                offsets[parent + 1] += 1
+        for i in range(len(ids)):
+            offsets[i + 1] += offsets[i]
+        children = array('q', [0]) * offsets[-1]
+        filled = array('q', offsets[:-1])
+        for i, parent in enumerate(parents):
+            if parent >= 0:
+                children[filled[parent]] = i
+                filled[parent] += 1
+        self.ids = ids
+        """The IDs of the locations, in ascending order.  A location's
+        position in this array is its position in the others."""
+        self.index = index
+        """Maps location IDs to positions."""
+        self.parents = parents
+        """The position of each location's parent, or -1."""
+        self.child_offsets = offsets
+        self.children_positions = children
+        """The positions of the children of the location at position
+        *i* are ``children_positions[child_offsets[i]:child_offsets[i + 1]]``."""
+        self.levels = levels
+        """The position in :py:data:`.LEVELS` of each location's level,
+        or ``len(LEVELS)`` for a location naming no level."""
+        self._ancestors_at_level = {}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, location_id):
+        return location_id in self.index
+
+    def _walk(self, position):
+        """Yield the positions of the ancestors of the location at
+        *position*, from its parent upward."""
+        parents = self.parents
+        # A chain without cycles visits each location at most once.
+        for _ in range(len(parents)):
+            position = parents[position]
+            if position < 0:
+                return
+            yield position
+
+    def parent(self, location_id):
+        """Return the ID of the parent of the location with ID
+        *location_id*, or None if it has none."""
+        parent = self.parents[self.index[location_id]]
+        return self.ids[parent] if parent >= 0 else None
+
+    def ancestors(self, location_id):
+        """Return a list of the IDs of the ancestors of the location
+        with ID *location_id*, from its parent upward."""
+        ids = self.ids
+        return [ids[position]
+                for position in self._walk(self.index[location_id])]
+
+    def children(self, location_id):
+        """Return a list of the IDs of the locations whose parent is the
+        location with ID *location_id*."""
+        position = self.index[location_id]
+        ids = self.ids
+        return [ids[child] for child in self.children_positions[
+            self.child_offsets[position]:self.child_offsets[position + 1]]]
+
+    def _ancestor_position(self, position, target):
+        if self.levels[position] == target:
+            return position
+        for ancestor in self._walk(position):
+            if self.levels[ancestor] == target:
+                return ancestor
+        return -1
+
+    def ancestor_at_level(self, location_id, level):
+        """Return the ID of the location at *level* (``'country'``,
+        ``'state'``, ``'county'`` or ``'city'``) that is the location
+        with ID *location_id* or one of its ancestors, or None if there
+        is none."""
+        position = self._ancestor_position(self.index[location_id],
+                                           LEVELS.index(level))
+        return self.ids[position] if position >= 0 else None
+
+    def ancestors_at_level(self, level):
+        """Return an array holding, for the location at each position,
+        the position of its ancestor at *level* (or of itself, if it is
+        at that level), or -1 if there is none."""
+        table = self._ancestors_at_level.get(level)
+        if table is None:
+            target = LEVELS.index(level)
+            table = array('q', [-1]) * len(self.ids)
+            levels = self.levels
+            parents = self.parents
+            # Visit parents before their children, so that each
+            # location takes its ancestor from its parent's entry.
+            done = bytearray(len(self.ids))
+            for start in range(len(self.ids)):
+                path = []
+                position = start
+                while position >= 0 and not done[position]:
+                    done[position] = 1
+                    path.append(position)
+                    position = parents[position]
+                ancestor = table[position] if position >= 0 else -1
+                for position in reversed(path):
+                    if levels[position] == target:
+                        ancestor = position
+                    table[position] = ancestor
+            # Publish the finished table with a single assignment.
+            tables = dict(self._ancestors_at_level)
+            tables[level] = table
+            self._ancestors_at_level = tables
+        return table
+
+    def rollup(self, location_ids, level, weights=None):
+        """Count the locations with IDs in the iterable *location_ids*
+        by their ancestors at *level*, as by :py:meth:`ancestor_at_level`,
+        and return a :py:class:`collections.Counter` mapping the IDs of
+        those ancestors to counts.  If *weights* is given, it is an
+        iterable of numbers parallel to *location_ids* to sum instead
+        of counting.  Unknown IDs, and locations without an ancestor at
+        *level*, are left out."""
+        table = self.ancestors_at_level(level)
+        index = self.index
+        totals = collections.Counter()
+        if weights is None:
+            for location_id, count in collections.Counter(location_ids).items():
+                position = index.get(location_id)
+                if position is not None and table[position] >= 0:
+                    totals[table[position]] += count
+        else:
+            for location_id, weight in zip(location_ids, weights):
+                position = index.get(location_id)
+                if position is not None and table[position] >= 0:
+                    totals[table[position]] += weight
+        ids = self.ids
+        return collections.Counter(
+            dict((ids[position], total) for position, total in totals.items()))
+
+    def __repr__(self):
+        return 'LocationHierarchy({} locations)'.format(len(self))
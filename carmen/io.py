@@ -0,0 +1,15 @@
+"""Opening of input and output files, shared by the command-line tools
+and the library modules that read files."""
+
+import gzip
+
+
+def open_file(filename, mode):
+    # Check for stdin/stdout case
+    if "_io.TextIOWrapper" in str(filename.__class__):
+        return filename
+    # GZIP case
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode)
+    else:
+        return open(filename, mode)
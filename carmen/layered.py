@@ -0,0 +1,109 @@
+"""Dictionaries that share their contents with copies of themselves.
+
+Resolvers keep their lookup tables in dictionaries that can hold an
+entry for every known location or name, and
+:py:meth:`.ResolverCollection.apply_delta` changes a copy of each
+resolver, and of the :py:class:`.LocationRegistry`, so that tweets
+being resolved meanwhile are unaffected.  Copying the tables outright
+would make every delta, however small, cost as much as loading the
+database.  A :py:class:`LayeredDict`
+instead holds a *base* dictionary, shared with its copies and never
+changed, and a private *layer* of the entries added, replaced or
+removed since it was copied, so that copying it and applying a delta
+take time in proportion to the number of entries changed.
+
+Looking an entry up in a layered dictionary runs Python code rather
+than the built-in dictionary's, so layers are only meant to last until
+the changed tables have been swapped in: :py:meth:`LayeredDict.merged`
+then turns each back into a plain dictionary, off the path of the
+swap."""
+
+try:
+    from collections.abc import MutableMapping
+except ImportError:  # Python 2
+    from collections import MutableMapping
+
+
+_ABSENT = object()
+_REMOVED = object()
+
+MERGE_FRACTION = 0.25
+"""A layer holding at least this fraction as many entries as its base
+is merged into a new base when the dictionary is next copied."""
+
+
+class LayeredDict(MutableMapping):
+    """A dictionary holding the entries of *base*, which it never
+    changes, overridden by the entries of *layer*, in which removed
+    keys map to a private marker."""
+
+    __slots__ = ('_base', '_layer')
+
+    def __init__(self, base=None, layer=None):
+        self._base = {} if base is None else base
+        self._layer = {} if layer is None else layer
+
+    def get(self, key, default=None):
+        value = self._layer.get(key, _ABSENT)
+        if value is _ABSENT:
+            return self._base.get(key, default)
+        if value is _REMOVED:
+            return default
+        return value
+
+    def __getitem__(self, key):
+        value = self.get(key, _ABSENT)
+        if value is _ABSENT:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, _ABSENT) is not _ABSENT
+
+    def __setitem__(self, key, value):
+        self._layer[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        self._layer[key] = _REMOVED
+
+    def __iter__(self):
+        # Copying a dictionary is atomic, so iterating over the copy is
+        # safe while other threads change the layer.
+        layer = dict(self._layer)
+        for key in self._base:
+            if key not in layer:
+                yield key
+        for key, value in layer.items():
+            if value is not _REMOVED:
+                yield key
+
+    def __len__(self):
+        length = len(self._base)
+        for key, value in list(self._layer.items()):
+            in_base = key in self._base
+            if value is _REMOVED:
+                length -= in_base
+            else:
+                length += not in_base
+        return length
+
+    def copy(self):
+        """Return a copy of this dictionary that shares its base."""
+        if len(self._layer) >= MERGE_FRACTION * len(self._base):
+            return LayeredDict(dict(self.items()))
+        return LayeredDict(self._base, dict(self._layer))
+
+    def merged(self):
+        """Return a plain dictionary with the entries of this one."""
+        merged = dict(self._base)
+        for key, value in list(self._layer.items()):
+            if value is _REMOVED:
+                merged.pop(key, None)
+            else:
+                merged[key] = value
+        return merged
+
+    def __repr__(self):
+        return 'LayeredDict({0!r})'.format(dict(self.items()))
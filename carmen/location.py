@@ -4,60 +4,104 @@ locations."""
 
 import itertools
 import json
+import pkgutil
+import warnings
+
+from .io import open_file
+from .layered import LayeredDict, MERGE_FRACTION
+
+try:
+    from types import MappingProxyType
+except ImportError:  # Python 2
+    MappingProxyType = dict
+
+
+LEVELS = ('country', 'state', 'county', 'city')
+"""The administrative levels of locations, from least to most
+specific."""
 
 
 class Location(object):
     """Contains information about a location and how it was identified.
+
+    Known locations are frozen (see :py:meth:`freeze`) when they are
+    added to a :py:class:`LocationRegistry`, since they are shared by
+    every resolution that returns them.
     """
 
+    _frozen = False
+
     def __init__(self, **kwargs):
-        self.latitude = 0.0
+        # Set attributes through the instance dictionary: going through
+        # __setattr__, which checks that the location is not frozen,
+        # would make construction several times slower, and resolvers
+        # build temporary locations for their lookups.
+        attrs = self.__dict__
+        attrs['latitude'] = 0.0
         """The latitude of this location's geographic center."""
-        self.longitude = 0.0
+        attrs['longitude'] = 0.0
         """The longitude of this location's geographic center."""
 
         # These should all be Unicode strings, not byte strings.
-        self.country = None
-        self.countrycode = None
-        self.state = None
-        self.county = None
-        self.city = None
+        attrs['country'] = None
+        attrs['countrycode'] = None
+        attrs['state'] = None
+        attrs['county'] = None
+        attrs['city'] = None
         """Basic location information.  A value of ``None`` for a
         particular field indicates that it does not apply for that
         specific location."""
 
-        self.aliases = []
+        attrs['aliases'] = []
         """An iterable containing alternative names for this location."""
 
-        self.time_zone = None
+        attrs['time_zone'] = None
         """A string containing the name of the time-zone for this location."""
 
-        self.resolution_method = None
-        """The method used to resolve this location's data from the
-        tweet that originally contained it."""
+        attrs['resolution_method'] = None
+        """Deprecated: resolvers no longer set this attribute.  The
+        method used to resolve a tweet is given by
+        :py:attr:`.Resolution.method`."""
 
-        self.known = False
+        attrs['known'] = False
         """True if this location appears in the database, False
         otherwise."""
-        self.id = -1
+        attrs['id'] = -1
         """For known locations, the database ID.  For other locations, a
         unique ID is arbitrarily assigned for each run."""
-        self.parent_id = -1
+        attrs['parent_id'] = -1
         
-        self.twitter_url = None
+        attrs['twitter_url'] = None
         """The Twitter URL corresponding to this Place."""
-        self.twitter_id = None
+        attrs['twitter_id'] = None
         """The Twitter ID of this Place."""
 
         # Assign the attributes to this location object
         for k, v in kwargs.items():
             if hasattr(self, k) and v:
-                setattr(self, k, v)
+                attrs[k] = v
+
+        attrs['id'] = int(attrs['id'])
+        attrs['parent_id'] = int(attrs['parent_id'])
+        attrs['latitude'] = float(attrs['latitude'])
+        attrs['longitude'] = float(attrs['longitude'])
+
+    def __setattr__(self, name, value):
+        if self._frozen:
+            raise AttributeError('{0!r} is read-only'.format(self))
+        object.__setattr__(self, name, value)
+
+    def freeze(self):
+        """Make this location read-only, so that setting any of its
+        attributes raises :py:exc:`AttributeError`.  Use
+        :py:func:`copy.copy` to get a modifiable copy."""
+        object.__setattr__(self, '_frozen', True)
 
-        self.id = int(self.id)
-        self.parent_id = int(self.parent_id)
-        self.latitude = float(self.latitude)
-        self.longitude = float(self.longitude)
+    def __copy__(self):
+        clone = Location.__new__(Location)
+        clone.__dict__.update(self.__dict__)
+        clone.__dict__.pop('_frozen', None)
+        return clone
 
     def __repr__(self):
         attrs = []
@@ -111,6 +155,15 @@ class Location(object):
             f'<CITY>, <ADMIN>, {countrycode}',
         ]))
 
+    def level(self):
+        """Return the name of the most specific administrative level
+        this location names (``'city'``, ``'county'``, ``'state'`` or
+        ``'country'``), or None for :py:data:`EARTH`."""
+        for level in ('city', 'county', 'state', 'country'):
+            if getattr(self, level):
+                return level
+        return None
+
     def parent(self):
         """Return a location representing the administrative unit above
         the one represented by this location."""
@@ -129,10 +182,164 @@ EARTH = Location()
 other locations."""
 
 
+def read_locations(location_file=None):
+    """Yield a ``(line_number, fields)`` pair for each JSON object in
+    *location_file*, or in the internal location database if
+    *location_file* is None.  Lines that cannot be parsed are skipped
+    with a warning and yielded with *fields* set to None."""
+    if location_file is None:
+        contents = pkgutil.get_data(__package__, 'data/geonames_locations_combined.json')
+        contents_string = contents.decode("ascii")
+        locations = contents_string.split('\n')
+    else:
+        with open_file(location_file, 'rb') as input:
+            locations = input.readlines()
+    for i, location_string in enumerate(locations):
+        if location_string.strip():
+            try:
+                fields = json.loads(location_string)
+            except ValueError as err:
+                warnings.warn("Issue adding location from line {0}. Skipping. {1}".format(i, err))
+                fields = None
+            yield i, fields
+
+
+class LocationRegistry(object):
+    """An immutable mapping from database IDs to known locations.
+
+    A registry can be shared by any number of resolvers, in any number
+    of resolver collections, without copying.  Changing the set of
+    known locations produces a new registry and leaves the old one
+    untouched, so resolvers built from different registries never see
+    each other's locations."""
+
+    __slots__ = ('_table', '_locations', '_hierarchy')
+
+    def __init__(self, locations=()):
+        locations_by_id = {}
+        for location in locations:
+            locations_by_id[location.id] = location
+        for location in locations_by_id.values():
+            location.freeze()
+        self._publish(locations_by_id)
+
+    def _publish(self, table):
+        # The table, a dictionary or LayeredDict, is never changed once
+        # published.
+        object.__setattr__(self, '_table', table)
+        object.__setattr__(self, '_locations', MappingProxyType(table))
+        object.__setattr__(self, '_hierarchy', None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('LocationRegistry objects are immutable')
+
+    def __reduce__(self):
+        return (LocationRegistry, (list(self._locations.values()),))
+
+    @classmethod
+    def load(cls, location_file=None):
+        """Return a registry containing the locations in
+        *location_file*, in the format accepted by
+        :py:meth:`.AbstractResolver.load_locations`, or in the internal
+        location database if *location_file* is None."""
+        locations = []
+        for i, fields in read_locations(location_file):
+            if fields is None:
+                continue
+            try:
+                locations.append(Location(known=True, **fields))
+            except ValueError as err:
+                warnings.warn("Issue adding location from line {0}. Skipping. {1}".format(i, err))
+        return cls(locations)
+
+    def updated(self, added=(), removed=()):
+        """Return a new registry containing this registry's locations,
+        except those whose IDs are in *removed*, plus the locations in
+        *added*, which replace any known locations with the same IDs.
+        The new registry shares the entries of this one that are left
+        unchanged (see :py:class:`.LayeredDict`), so small changes are
+        quick to make however many locations are known."""
+        added = list(added)
+        removed = set(removed)
+        if len(added) + len(removed) >= MERGE_FRACTION * len(self):
+            return LocationRegistry(itertools.chain(
+                (location for location in self._locations.values()
+                 if location.id not in removed),
+                added))
+        if isinstance(self._table, LayeredDict):
+            table = self._table.copy()
+        else:
+            table = LayeredDict(self._table)
+        for location_id in removed:
+            table.pop(location_id, None)
+        for location in added:
+            location.freeze()
+            table[location.id] = location
+        registry = LocationRegistry.__new__(LocationRegistry)
+        registry._publish(table)
+        return registry
+
+    def merge_layers(self):
+        """Hold this registry's locations in a plain dictionary, which
+        is quicker to look up, if :py:meth:`updated` layered them over
+        another registry's.  The locations themselves are unchanged."""
+        if isinstance(self._table, LayeredDict):
+            table = self._table.merged()
+            object.__setattr__(self, '_table', table)
+            object.__setattr__(self, '_locations', MappingProxyType(table))
+
+    def get(self, location_id, default=None):
+        return self._locations.get(location_id, default)
+
+    def __getitem__(self, location_id):
+        return self._locations[location_id]
+
+    def __contains__(self, location_id):
+        return location_id in self._locations
+
+    def __iter__(self):
+        return iter(self._locations)
+
+    def __len__(self):
+        return len(self._locations)
+
+    def ids(self):
+        return self._locations.keys()
+
+    def locations(self):
+        """Return a view of the locations in this registry."""
+        return self._locations.values()
+
+    @property
+    def hierarchy(self):
+        """The :py:class:`.LocationHierarchy` of this registry's
+        locations, built when first needed."""
+        hierarchy = self._hierarchy
+        if hierarchy is None:
+            from .hierarchy import LocationHierarchy
+            hierarchy = LocationHierarchy(self)
+            object.__setattr__(self, '_hierarchy', hierarchy)
+        return hierarchy
+
+    def __repr__(self):
+        return 'LocationRegistry({} locations)'.format(len(self))
+
+
+EMPTY_REGISTRY = LocationRegistry()
+"""A registry containing no locations."""
+
+
 class LocationEncoder(json.JSONEncoder):
-    """JSON encoder supporting `Location` objects."""
+    """JSON encoder supporting `Location` objects, and resolutions
+    returned by resolvers, which are encoded as their locations with the
+    resolution method added."""
     encoding = 'utf-8'
     def default(self, obj):
+        resolution_method = None
+        if isinstance(getattr(obj, 'location', None), Location):
+            # A resolution, which carries the method separately.
+            resolution_method = obj.method
+            obj = obj.location
         if isinstance(obj, Location):
             to_encode = {}
             for k in ('country', 'state', 'county', 'city', 'id',
@@ -140,6 +347,8 @@ class LocationEncoder(json.JSONEncoder):
                 # We don't use hasattr here because we're checking for
                 # None values; the attributes themselves always exist.
                 v = getattr(obj, k)
+                if k == 'resolution_method' and resolution_method:
+                    v = resolution_method
                 if v:
                     import sys
                     if sys.version_info[0] < 3:
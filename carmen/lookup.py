@@ -0,0 +1,278 @@
+"""Pre-resolved lookup tables of profile location strings.
+
+The same profile location strings recur across very many tweets.  A
+lookup table maps each of a set of distinct strings, exactly as they
+appear in tweets, to the location the ``profile`` resolver found for
+it, or to no location.  The table is built once, in parallel, with::
+
+    python -m carmen.lookup [options] strings_path table_path
+
+and loaded by the ``profile`` resolver's *lookup_table* option, which
+memory-maps it and consults it before doing any normalization.
+
+A table is an open-addressing hash table stored in a single file:
+
+*   a header of the magic bytes ``CARMENLT``, the number of slots (a
+    power of two), the number of entries, and the offset of the key
+    data, as little-endian unsigned 64-bit integers;
+*   the slots, each holding the 64-bit BLAKE2b hash of a key's UTF-8
+    encoding (0 for an empty slot), the offset and length of the key
+    in the key data, flags, and a location ID (-1 for no location).
+    Bit 0 of the flags is set for a provisional resolution, bit 1 if
+    the resolution's confidence is recorded, and bits 8 to 31 hold the
+    confidence in millionths;
+*   the UTF-8 encoded keys, one after another.
+
+Keys are compared in full after a hash match, so hash collisions never
+give wrong answers.  Lookups probe linearly from the slot given by the
+hash, and the table is kept at most half full, so most lookups probe
+one or two slots.
+"""
+from __future__ import division, print_function
+
+import argparse
+import hashlib
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import warnings
+
+from .io import open_file
+from .resolver import Resolution
+
+
+MAGIC = b'CARMENLT'
+HEADER = struct.Struct('<8sQQQ')
+SLOT = struct.Struct('<QQIIq')
+PROVISIONAL = 1
+HAS_CONFIDENCE = 2
+CONFIDENCE_SHIFT = 8
+CONFIDENCE_SCALE = 1000000
+MAX_LOAD_FACTOR = 0.5
+
+
+def _hash(key):
+    """Return the nonzero 64-bit hash of the bytes *key*."""
+    value = struct.unpack('<Q', hashlib.blake2b(key, digest_size=8).digest())[0]
+    return value or 1
+
+
+class LookupTable(object):
+    """A memory-mapped lookup table read from *path*."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as table_file:
+            self._map = mmap.mmap(table_file.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError('%s is not a Carmen lookup table' % path)
+        magic, self._num_slots, self._num_entries, self._keys_offset = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a Carmen lookup table' % path)
+        self._mask = self._num_slots - 1
+
+    def __len__(self):
+        return self._num_entries
+
+    def get(self, string):
+        """Return a ``(provisional, location_id, confidence)`` triple
+        for *string*, with a *location_id* of -1 if it was resolved to no
+        location and a *confidence* of None if the table does not record
+        it, or None if *string* is not in the table."""
+        if not self._num_slots:
+            return None
+        key = string.encode('utf-8', 'surrogatepass')
+        key_hash = _hash(key)
+        table = self._map
+        keys_offset = self._keys_offset
+        mask = self._mask
+        slot = key_hash & mask
+        while True:
+            slot_hash, key_offset, key_length, flags, location_id = \
+                SLOT.unpack_from(table, HEADER.size + slot * SLOT.size)
+            if slot_hash == 0:
+                return None
+            if slot_hash == key_hash and key_length == len(key):
+                start = keys_offset + key_offset
+                if table[start:start + key_length] == key:
+                    confidence = None
+                    if flags & HAS_CONFIDENCE:
+                        confidence = (flags >> CONFIDENCE_SHIFT) / CONFIDENCE_SCALE
+                    return (bool(flags & PROVISIONAL), location_id, confidence)
+            slot = (slot + 1) & mask
+
+    def close(self):
+        self._map.close()
+
+    def __reduce__(self):
+        # Reopen the file rather than pickling the mapping.
+        return (LookupTable, (self.path,))
+
+
+def write_table(path, entries):
+    """Write a lookup table of *entries*, ``(string, provisional,
+    location_id, confidence)`` tuples with distinct strings, to *path*.
+    *location_id* and *confidence* may be None."""
+    entries = list(entries)
+    num_slots = 1
+    while num_slots * MAX_LOAD_FACTOR < len(entries):
+        num_slots *= 2
+    slots = bytearray(num_slots * SLOT.size)
+    occupied = bytearray(num_slots)
+    mask = num_slots - 1
+    keys = []
+    key_offset = 0
+    for string, provisional, location_id, confidence in entries:
+        key = string.encode('utf-8', 'surrogatepass')
+        key_hash = _hash(key)
+        slot = key_hash & mask
+        while occupied[slot]:
+            slot = (slot + 1) & mask
+        occupied[slot] = 1
+        flags = PROVISIONAL if provisional else 0
+        if confidence is not None:
+            confidence = min(max(confidence, 0.0), 1.0)
+            flags |= HAS_CONFIDENCE | (
+                int(round(confidence * CONFIDENCE_SCALE)) << CONFIDENCE_SHIFT)
+        SLOT.pack_into(slots, slot * SLOT.size, key_hash, key_offset,
+                       len(key), flags,
+                       -1 if location_id is None else location_id)
+        keys.append(key)
+        key_offset += len(key)
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as output:
+        output.write(HEADER.pack(MAGIC, num_slots, len(entries),
+                                 HEADER.size + len(slots)))
+        output.write(slots)
+        for key in keys:
+            output.write(key)
+    os.replace(temporary, path)
+
+
+_worker_resolver = None
+
+
+def _init_worker(location_file, options):
+    global _worker_resolver
+    from .resolvers.profile import ProfileResolver
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        resolver = ProfileResolver(**options)
+        resolver.load_locations(location_file=location_file)
+    _worker_resolver = resolver
+
+
+def _resolve_strings(strings):
+    results = []
+    for string in strings:
+        resolution = _worker_resolver.resolve_string(string)
+        if resolution is None:
+            results.append((string, False, None, None))
+        else:
+            resolution = Resolution.of(resolution)
+            results.append((string, resolution.provisional,
+                            resolution.location.id, resolution.confidence))
+    return results
+
+
+def read_strings(path, json_lines=False):
+    """Yield the distinct strings in *path*, one per line, or one JSON
+    string per line if *json_lines* is True."""
+    seen = set()
+    with open_file(path, 'rb') as input:
+        for line in input:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if json_lines:
+                if not line.strip():
+                    continue
+                string = json.loads(line)
+            else:
+                string = line.rstrip('\r\n')
+            if string and string not in seen:
+                seen.add(string)
+                yield string
+
+
+def build(strings_path, table_path, location_file=None, options=None,
+          processes=None, batch_size=10000, json_lines=False):
+    """Resolve the distinct strings in *strings_path* with a
+    ``profile`` resolver built with *options* and the locations in
+    *location_file*, using *processes* worker processes (the number of
+    CPUs if None; no workers if 1), and write the results as a lookup
+    table to *table_path*.  Return the number of strings and the number
+    resolved to a location."""
+    options = dict(options or {})
+    options.pop('lookup_table', None)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    def batches():
+        batch = []
+        for string in read_strings(strings_path, json_lines=json_lines):
+            batch.append(string)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    pool = None
+    if processes > 1:
+        pool = multiprocessing.Pool(processes, _init_worker,
+                                    (location_file, options))
+        results = pool.imap(_resolve_strings, batches())
+    else:
+        _init_worker(location_file, options)
+        results = map(_resolve_strings, batches())
+    entries = []
+    try:
+        for batch_results in results:
+            entries.extend(batch_results)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    write_table(table_path, entries)
+    resolved = sum(1 for _, _, location_id, _ in entries if location_id is not None)
+    return len(entries), resolved
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Build a lookup table of pre-resolved profile '
+                    'locations for the profile resolver\'s lookup_table '
+                    'option.',
+        epilog='Paths ending in ".gz" are treated as gzipped files.')
+    parser.add_argument('strings_file', metavar='strings_path',
+        help='file of profile location strings, one per line')
+    parser.add_argument('table_file', metavar='table_path',
+        help='path to write the lookup table to')
+    parser.add_argument('--locations', metavar='PATH', dest='location_file',
+        help='path to alternative location database')
+    parser.add_argument('--options', default='{}',
+        help='JSON dictionary of profile resolver options')
+    parser.add_argument('--json', action='store_true', dest='json_lines',
+        help='read one JSON-encoded string per line, so that strings may '
+             'contain newlines')
+    parser.add_argument('-p', '--processes', type=int,
+        help='number of worker processes (defaults to the number of CPUs)')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    total, resolved = build(
+        args.strings_file, args.table_file,
+        location_file=args.location_file, options=json.loads(args.options),
+        processes=args.processes, json_lines=args.json_lines)
+    print('Resolved %d of %d distinct strings.' % (resolved, total),
+          file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Resolution of tweets on a pool of threads.
+
+The locations resolvers return are read-only (see
+:py:class:`.Resolution`), and one resolver can serve any number of
+threads.  Unlike worker processes, threads share a single copy of the
+location database.  Resolution changes shared state in only three ways,
+each safe for concurrent use:
+
+*   The ``place`` resolver, with ``allow_unknown_locations``, adds each
+    unknown Place it sees as a location while resolving.  It does so
+    under a lock, which is also held while it builds the tables derived
+    from its locations.
+*   Indexes built on first use (the ``profile`` resolver's fuzzy index,
+    the ``place`` resolver's spatial index and seq2seq name tables, and
+    the ``timezone`` resolver's index) are published with a single
+    assignment once complete, so other threads never see them half
+    built, although more than one thread may build the same index.
+*   In adaptive mode, :py:class:`.ResolverCollection` counts the calls
+    and hits of each resolver (see :py:class:`.ResolverStats`) without
+    a lock, so concurrent updates can be lost and the counts may come
+    out slightly low.  Resolutions are unaffected.
+
+On
+builds of Python with a global interpreter lock, threads only speed up
+work that releases the lock, such as NumPy computations and I/O; on
+free-threaded builds, resolution itself runs in parallel.
+
+Work is handed to the threads in chunks of consecutive tweets, to keep
+the cost of scheduling low, and only a bounded number of chunks is in
+flight at once, so that arbitrarily long inputs can be streamed.
+Results are always produced in input order."""
+
+import collections
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+
+DEFAULT_CHUNK_SIZE = 256
+
+
+def chunks(iterable, chunk_size):
+    """Yield lists of up to *chunk_size* consecutive items of
+    *iterable*."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def imap_chunks(function, iterable, threads, chunk_size=DEFAULT_CHUNK_SIZE,
+                max_pending=None):
+    """Call *function* on each list of up to *chunk_size* consecutive
+    items of *iterable* on a pool of *threads* threads, and yield the
+    items of the lists it returns, in order.  At most *max_pending*
+    chunks (by default, twice the number of threads) are submitted but
+    not yet yielded at any time, so *iterable* is consumed only as fast
+    as results are."""
+    if max_pending is None:
+        max_pending = 2 * threads
+    pending = collections.deque()
+    with ThreadPoolExecutor(threads, thread_name_prefix='carmen') as executor:
+        try:
+            for chunk in chunks(iterable, chunk_size):
+                pending.append(executor.submit(function, chunk))
+                if len(pending) >= max_pending:
+                    for result in pending.popleft().result():
+                        yield result
+            while pending:
+                for result in pending.popleft().result():
+                    yield result
+        finally:
+            # If the caller stops early, don't wait for work it will
+            # never see.
+            for future in pending:
+                future.cancel()
+
+
+def resolve_threaded(resolver, tweets, threads, chunk_size=DEFAULT_CHUNK_SIZE,
+                     batch=False):
+    """Resolve each of *tweets*, an iterable, with *resolver* on
+    *threads* threads, and yield the resolutions in order.  If *batch*
+    is True, each chunk of tweets is resolved with
+    :py:meth:`.ResolverCollection.resolve_batch`; otherwise each tweet
+    is resolved with :py:meth:`~.AbstractResolver.resolve_tweet`."""
+    if batch:
+        function = resolver.resolve_batch
+    else:
+        def function(chunk):
+            return [resolver.resolve_tweet(tweet) for tweet in chunk]
+    return imap_chunks(function, tweets, threads, chunk_size=chunk_size)
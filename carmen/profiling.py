@@ -0,0 +1,255 @@
+"""Profiling of the stages of a Carmen run.
+
+:py:class:`StageTimes` accumulates the wall-clock and CPU time spent in
+named stages, such as reading input or running one resolver, and
+:py:class:`SamplingProfiler` periodically samples the call stack of a
+thread, writing the samples in the collapsed-stack format read by
+flame graph tools such as ``flamegraph.pl`` and speedscope."""
+
+from __future__ import division, print_function
+
+import collections
+import os
+import signal
+import sys
+import threading
+import time
+
+
+_wall_clock = time.perf_counter
+_cpu_clock = getattr(time, 'thread_time', time.process_time)
+
+
+class _Stage(object):
+    """A reusable context manager that adds the time spent inside it to
+    one stage's totals."""
+
+    __slots__ = ('totals', 'wall_start', 'cpu_start')
+
+    def __init__(self, totals):
+        self.totals = totals
+
+    def __enter__(self):
+        self.wall_start = _wall_clock()
+        self.cpu_start = _cpu_clock()
+        return self
+
+    def __exit__(self, *exc_info):
+        totals = self.totals
+        totals[0] += 1
+        totals[1] += _wall_clock() - self.wall_start
+        totals[2] += _cpu_clock() - self.cpu_start
+        return False
+
+
+class _NullStage(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_STAGE = _NullStage()
+"""A context manager that does nothing, for use in place of a stage
+when profiling is off."""
+
+
+class StageTimes(object):
+    """Accumulates the number of calls, wall-clock time and CPU time of
+    named stages.  Stages named ``parent/child`` are reported as part of
+    the stage ``parent``.  Stages are not reentrant."""
+
+    def __init__(self):
+        # Maps stage names to [calls, wall time, CPU time].
+        self.totals = collections.OrderedDict()
+        self._stages = {}
+        self._start = _wall_clock()
+
+    def stage(self, name):
+        """Return a context manager that times the stage *name*."""
+        stage = self._stages.get(name)
+        if stage is None:
+            totals = self.totals[name] = [0, 0.0, 0.0]
+            stage = self._stages[name] = _Stage(totals)
+        return stage
+
+    def timed_iter(self, name, iterable):
+        """Iterate over *iterable*, timing each step as the stage
+        *name*."""
+        iterator = iter(iterable)
+        stage = self.stage(name)
+        while True:
+            with stage:
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def elapsed(self):
+        """Return the wall-clock time since these times were created."""
+        return _wall_clock() - self._start
+
+    def write_summary(self, file=sys.stderr):
+        """Write a table of the time spent in each stage to *file*."""
+        total = self.elapsed()
+        print('%-28s %10s %10s %10s %7s %11s' % (
+            'stage', 'calls', 'wall (s)', 'cpu (s)', 'wall %', 'us/call'),
+            file=file)
+        # List each stage's substages after it, keeping the order in
+        # which stages were first used.
+        order = {}
+        for name in self.totals:
+            order.setdefault(name.split('/')[0], len(order))
+        names = sorted(self.totals, key=lambda name: (
+            order[name.split('/')[0]], '/' in name))
+        accounted = 0.0
+        for name in names:
+            calls, wall, cpu = self.totals[name]
+            if '/' in name:
+                label = '  ' + name.split('/', 1)[1]
+            else:
+                label = name
+                accounted += wall
+            print('%-28s %10d %10.3f %10.3f %6.1f%% %11.1f' % (
+                label, calls, wall, cpu, 100 * wall / total if total else 0,
+                1e6 * wall / calls if calls else 0), file=file)
+        print('%-28s %10s %10.3f %10s %6.1f%%' % (
+            '(other)', '', total - accounted, '',
+            100 * (total - accounted) / total if total else 0), file=file)
+        print('%-28s %10s %10.3f' % ('total', '', total), file=file)
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    # Shorten paths to the last two components, e.g. resolvers/place.py.
+    parts = filename.replace('\\', '/').rsplit('/', 2)
+    return '%s (%s:%d)' % (code.co_name, '/'.join(parts[-2:]),
+                           code.co_firstlineno)
+
+
+class SamplingProfiler(object):
+    """Samples the call stack of the calling thread every *interval*
+    seconds, and counts identical stacks.
+
+    Where possible, samples are taken by a ``SIGPROF`` interval timer,
+    so *interval* is measured in CPU time and the profiled code runs at
+    full speed between samples.  On platforms without ``setitimer``, or
+    when not called from the main thread, a background thread samples
+    the stack every *interval* seconds of wall-clock time instead; such
+    samples are biased towards points where the profiled thread
+    releases the interpreter lock, such as I/O."""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.thread_id = threading.current_thread().ident
+        self.samples = collections.Counter()
+        self._labels = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._previous_handler = None
+
+    def _record(self, frame):
+        stack = []
+        labels = self._labels
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = labels[code] = _frame_label(code)
+            stack.append(label)
+            frame = frame.f_back
+        stack.reverse()
+        self.samples[';'.join(stack)] += 1
+
+    def _handle_signal(self, signum, frame):
+        self._record(frame)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self._record(frame)
+
+    def _can_use_signals(self):
+        return (hasattr(signal, 'setitimer') and hasattr(signal, 'SIGPROF') and
+                threading.current_thread() is threading.main_thread())
+
+    def start(self):
+        if self._can_use_signals():
+            self._previous_handler = signal.signal(signal.SIGPROF,
+                                                   self._handle_signal)
+            signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='carmen-profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._previous_handler is not None:
+            signal.setitimer(signal.ITIMER_PROF, 0)
+            signal.signal(signal.SIGPROF, self._previous_handler)
+            self._previous_handler = None
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+    def write_collapsed(self, path):
+        """Write the samples to *path* in collapsed-stack format: one
+        line per distinct stack, with frames separated by semicolons
+        from the outermost in, followed by the number of samples."""
+        temporary = path + '.tmp'
+        with open(temporary, 'w') as output:
+            for stack, count in self.samples.most_common():
+                output.write('%s %d\n' % (stack, count))
+        os.replace(temporary, path)
+
+
+class TimedResolver(object):
+    """Wraps *resolver* so that its resolutions are timed as the stage
+    *name* of *times*.  Other attributes are those of the wrapped
+    resolver."""
+
+    def __init__(self, resolver, times, name):
+        self.resolver = resolver
+        stage = times.stage(name)
+        resolve_tweet = resolver.resolve_tweet
+
+        def timed_resolve_tweet(tweet):
+            with stage:
+                return resolve_tweet(tweet)
+        self.resolve_tweet = timed_resolve_tweet
+        resolve_geo = resolver.resolve_geo
+        if resolve_geo is None:
+            self.resolve_geo = None
+        else:
+            def timed_resolve_geo(geo):
+                with stage:
+                    return resolve_geo(geo)
+            self.resolve_geo = timed_resolve_geo
+
+    def __getattr__(self, name):
+        return getattr(self.resolver, name)
+
+
+def instrument(collection, times, prefix='resolve/'):
+    """Time each child resolver of the :py:class:`.ResolverCollection`
+    *collection* as a stage of *times*, named with *prefix* followed
+    by the resolver's name."""
+    collection.resolvers = [
+        (resolver_name, TimedResolver(resolver, times, prefix + resolver_name))
+        for resolver_name, resolver in collection.resolvers]
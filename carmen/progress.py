@@ -0,0 +1,212 @@
+"""Progress reporting for long runs of the command-line tool.
+
+:py:class:`Progress` shows throughput, an estimated time remaining
+based on the position in the input file, the resolution rate and the
+process's memory use, using tqdm if it is installed.  It can also write
+the same figures as a JSON metrics file at regular intervals, for job
+schedulers and dashboards to read.
+
+The caller counts tweets itself and only calls :py:meth:`Progress.update`
+once its count reaches :py:attr:`Progress.next_check`, which is set so
+that the clock is read a few times per reporting interval whatever the
+throughput.  A caller that reads input ahead of the tweets it has
+finished, as when resolving on several threads, counts finished tweets
+and passes the input position at which the last of them was read."""
+
+from __future__ import division, print_function
+
+import json
+import os
+import sys
+import time
+
+try:
+    from tqdm import tqdm
+except ImportError:
+    tqdm = None
+
+
+def _raw_file(fileobj):
+    """Return the file underlying *fileobj*, looking through gzip
+    decompression, so that its position is in compressed bytes."""
+    return getattr(fileobj, 'fileobj', None) or getattr(fileobj, 'buffer', None) or fileobj
+
+
+def _input_size(raw):
+    try:
+        return os.fstat(raw.fileno()).st_size or None
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def resident_memory():
+    """Return the resident set size of this process in bytes, or None
+    if it cannot be determined."""
+    try:
+        with open('/proc/self/statm') as statm:
+            pages = int(statm.read().split()[1])
+    except (IOError, OSError, IndexError, ValueError):
+        return None
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+
+def _format_duration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+
+
+class Progress(object):
+    """Reports progress through the input *fileobj*.  If *display* is
+    True, progress is shown on *stream* every *interval* seconds; if
+    *metrics_file* is given, a JSON snapshot is written there every
+    *metrics_interval* seconds."""
+
+    def __init__(self, fileobj, display=True, interval=1.0, metrics_file=None,
+                 metrics_interval=30.0, stream=sys.stderr):
+        self.display = display
+        self.interval = interval
+        self.metrics_file = metrics_file
+        self.metrics_interval = metrics_interval
+        self.stream = stream
+        self._raw = _raw_file(fileobj)
+        self.total_bytes = _input_size(self._raw)
+        self.next_check = 1
+        self.start_time = self._last_display = self._last_metrics = time.time()
+        self._last_check = (self.start_time, 0)
+        self._bar = None
+        if display and tqdm is not None:
+            self._bar = tqdm(total=self.total_bytes, unit='B', unit_scale=True,
+                             unit_divisor=1024, file=stream, mininterval=interval,
+                             dynamic_ncols=True)
+
+    def position(self):
+        """Return the number of bytes of the input file consumed so far
+        (before decompression), or None if it is unknown."""
+        try:
+            return self._raw.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+
+    def snapshot(self, tweets, resolved, method_counts, now=None,
+                 position=None):
+        """Return a dictionary of metrics for the run so far.  If
+        *position* is None, the current position in the input file is
+        used."""
+        now = time.time() if now is None else now
+        elapsed = now - self.start_time
+        if position is None:
+            position = self.position()
+        snapshot = {
+            'time': now,
+            'elapsed_seconds': elapsed,
+            'tweets': tweets,
+            'resolved': resolved,
+            'resolution_rate': resolved / tweets if tweets else None,
+            'resolution_methods': dict(method_counts),
+            'tweets_per_second': tweets / elapsed if elapsed > 0 else None,
+            'bytes_read': position,
+            'total_bytes': self.total_bytes,
+            'bytes_per_second': None,
+            'fraction_done': None,
+            'eta_seconds': None,
+            'rss_bytes': resident_memory(),
+        }
+        if position is not None and elapsed > 0:
+            snapshot['bytes_per_second'] = position / elapsed
+            if self.total_bytes:
+                fraction = min(position / self.total_bytes, 1.0)
+                snapshot['fraction_done'] = fraction
+                if position:
+                    snapshot['eta_seconds'] = (
+                        elapsed * (self.total_bytes - position) / position)
+        return snapshot
+
+    def update(self, tweets, resolved, method_counts, position=None):
+        """Report progress after *tweets* tweets, *resolved* of them
+        resolved, with *method_counts* mapping resolver names to the
+        number of tweets each resolved, if a report is due.  *position*
+        is the position in the input file up to which those tweets were
+        read, if it is behind the file's current position."""
+        now = time.time()
+        # Aim to check the clock about ten times per interval.
+        last_time, last_tweets = self._last_check
+        period = min(self.interval if self.display else float('inf'),
+                     self.metrics_interval if self.metrics_file else float('inf'))
+        if now > last_time and tweets > last_tweets:
+            rate = (tweets - last_tweets) / (now - last_time)
+            self.next_check = tweets + max(1, int(rate * period / 10))
+        else:
+            self.next_check = tweets + 1
+        self._last_check = (now, tweets)
+        show = self.display and now - self._last_display >= self.interval
+        write = (self.metrics_file and
+                 now - self._last_metrics >= self.metrics_interval)
+        if not (show or write):
+            return
+        snapshot = self.snapshot(tweets, resolved, method_counts, now=now,
+                                 position=position)
+        if show:
+            self._last_display = now
+            self._show(snapshot)
+        if write:
+            self._last_metrics = now
+            self.write_metrics(snapshot)
+
+    def _summary(self, snapshot):
+        parts = ['%d tweets' % snapshot['tweets']]
+        if snapshot['tweets_per_second'] is not None:
+            parts.append('%.0f tweets/s' % snapshot['tweets_per_second'])
+        if snapshot['resolution_rate'] is not None:
+            parts.append('%.1f%% resolved' % (100 * snapshot['resolution_rate']))
+        methods = snapshot['resolution_methods']
+        if methods and snapshot['tweets']:
+            parts.append(' '.join(
+                '%s %.1f%%' % (method, 100 * count / snapshot['tweets'])
+                for method, count in sorted(methods.items(), key=lambda item: -item[1])))
+        if snapshot['rss_bytes'] is not None:
+            parts.append('RSS %.0f MB' % (snapshot['rss_bytes'] / 1048576))
+        return ', '.join(parts)
+
+    def _show(self, snapshot):
+        if self._bar is not None:
+            position = snapshot['bytes_read']
+            if position is not None and position > self._bar.n:
+                self._bar.update(position - self._bar.n)
+            self._bar.set_postfix_str(self._summary(snapshot), refresh=True)
+            return
+        parts = []
+        if snapshot['fraction_done'] is not None:
+            parts.append('%.1f%%' % (100 * snapshot['fraction_done']))
+        if snapshot['bytes_per_second'] is not None:
+            parts.append('%.1f MB/s' % (snapshot['bytes_per_second'] / 1048576))
+        if snapshot['eta_seconds'] is not None:
+            parts.append('ETA %s' % _format_duration(snapshot['eta_seconds']))
+        line = ', '.join(parts + [self._summary(snapshot)])
+        if self.stream.isatty():
+            # Overwrite the previous report.
+            self.stream.write('\r\033[K' + line)
+        else:
+            self.stream.write(line + '\n')
+        self.stream.flush()
+
+    def write_metrics(self, snapshot):
+        """Write *snapshot* to the metrics file, replacing the file
+        atomically so that readers never see a partial snapshot."""
+        temporary = self.metrics_file + '.tmp'
+        with open(temporary, 'w') as output:
+            json.dump(snapshot, output, sort_keys=True)
+            output.write('\n')
+        os.replace(temporary, self.metrics_file)
+
+    def close(self, tweets, resolved, method_counts):
+        """Make a final report."""
+        snapshot = self.snapshot(tweets, resolved, method_counts)
+        snapshot['finished'] = True
+        if self.display:
+            self._show(snapshot)
+            if self._bar is not None:
+                self._bar.close()
+            elif self.stream.isatty():
+                self.stream.write('\n')
+        if self.metrics_file:
+            self.write_metrics(snapshot)
@@ -1,29 +1,40 @@
 """Resolvers based on geocodes."""
 
 
-from collections import defaultdict
-import warnings
-
 from geopy import Point
 from geopy.distance import distance as geopy_distance
 
-from ..location import EARTH
-from ..resolver import AbstractResolver, register
+from ..extract import extract_geo
+from ..resolver import AbstractResolver, Resolution, register
+
+
+EARTH_RADIUS_MILES = 3958.7613
 
-def safe_get(dic, key):
-    temp = dic.get(key)
-    return {} if temp is None else temp
 
 @register('geocode')
 class GeocodeResolver(AbstractResolver):
     """A resolver that locates a tweet by finding the known location
     with the shortest geographic distance from the tweet's coordinates.
+    The resolution's score is that distance in miles, and its
+    confidence falls linearly from 1 at the location itself to 0 at
+    *max_distance*.
     """
 
+    geo_fields = ('coordinates', 'bbox')
+
     def __init__(self, max_distance=25, cell_size=0.5):
         self.max_distance = float(max_distance)
         self.cell_size = float(cell_size)
-        self.location_map = defaultdict(dict)
+        self.location_map = {}
+        self._cell_arrays = {}
+        # The cells of location_map whose dictionaries this resolver
+        # may change in place, or None for all of them; see copy().
+        self._owned_cells = None
+
+    def distance_confidence(self, distance):
+        """Return the confidence of a resolution *distance* miles from
+        the tweet's coordinates.  *distance* may be a NumPy array."""
+        return 1.0 - distance / self.max_distance
 
     def round_func(self, x):
         return round(x / self.cell_size)
@@ -38,77 +49,127 @@ class GeocodeResolver(AbstractResolver):
             for j in [y-1,y,y+1]:
                 yield (i,j)
 
+    def _own_cell(self, cell):
+        """Return the dictionary of the locations near *cell*, first
+        replacing it with a copy if it is shared with another
+        resolver."""
+        cell_locations = self.location_map.get(cell)
+        if cell_locations is None:
+            cell_locations = self.location_map[cell] = {}
+        elif self._owned_cells is not None and cell not in self._owned_cells:
+            cell_locations = self.location_map[cell] = dict(cell_locations)
+        if self._owned_cells is not None:
+            self._owned_cells.add(cell)
+        return cell_locations
+
     def add_location(self, location):
         if not location.latitude and location.longitude:
             return
         for cell in self._neighbors(self._cell_for(location.latitude,location.longitude)):
-            self.location_map[cell][location.id] = location
+            self._own_cell(cell)[location.id] = location
+            self._cell_arrays.pop(cell, None)
+
+    def remove_location(self, location):
+        for cell in self._neighbors(self._cell_for(location.latitude,location.longitude)):
+            cell_locations = self.location_map.get(cell)
+            if cell_locations and cell_locations.get(location.id) is location:
+                del self._own_cell(cell)[location.id]
+                self._cell_arrays.pop(cell, None)
+
+    def copy(self, layered=False):
+        # The dictionaries of the cells' locations are shared by the
+        # copy, and each resolver copies the dictionary of a cell
+        # before first changing it.
+        clone = super(GeocodeResolver, self).copy(layered)
+        self._owned_cells = set()
+        clone._owned_cells = set()
+        return clone
+
+    def _candidate_arrays(self, cell):
+        '''Return NumPy arrays of the ids, latitudes and longitudes of the
+        known locations near *cell*, building them on first use.'''
+        arrays = self._cell_arrays.get(cell)
+        if arrays is None:
+            import numpy as np
+            candidates = list(self.location_map.get(cell, {}).values())
+            arrays = (
+                np.array([c.id for c in candidates], dtype=np.int64),
+                np.radians([c.latitude for c in candidates]),
+                np.radians([c.longitude for c in candidates]))
+            self._cell_arrays[cell] = arrays
+        return arrays
+
+    def resolve_coordinates(self, latitudes, longitudes):
+        """Resolve many coordinates at once, without wrapping them in
+        tweets.  *latitudes* and *longitudes* may be NumPy arrays or any
+        sequences of equal length.  Return a pair of NumPy arrays: the
+        id of the closest known location for each point, and its
+        distance in miles.  Points with no known location within
+        *max_distance* have a distance of ``inf`` and an ID of ``-1``,
+        which is also the ID of :py:data:`.EARTH`, so unresolved points
+        are told apart by their distances.
+
+        Points are grouped by grid cell and each group is matched
+        against its candidates in one vectorized step.  Distances are
+        great-circle (haversine) distances, which differ from the
+        geodesic distances used by :py:meth:`resolve_tweet` by well
+        under one percent.
+        """
+        import numpy as np
+        latitudes = np.asarray(latitudes, dtype=float).ravel()
+        longitudes = np.asarray(longitudes, dtype=float).ravel()
+        if latitudes.shape != longitudes.shape:
+            raise ValueError('latitudes and longitudes must have the same length')
+        location_ids = np.full(latitudes.shape, -1, dtype=np.int64)
+        distances = np.full(latitudes.shape, np.inf)
+        valid = np.flatnonzero(np.isfinite(latitudes) & np.isfinite(longitudes))
+        if not len(valid):
+            return location_ids, distances
+        # Same rounding as round_func: NumPy, like round(), rounds
+        # halves to even.
+        cells = np.stack([
+            np.round(latitudes[valid] / self.cell_size),
+            np.round(longitudes[valid] / self.cell_size)], axis=1).astype(np.int64)
+        unique_cells, inverse = np.unique(cells, axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        order = np.argsort(inverse, kind='stable')
+        bounds = np.searchsorted(inverse[order], np.arange(len(unique_cells) + 1))
+        lat_radians = np.radians(latitudes)
+        lon_radians = np.radians(longitudes)
+        for k, (x, y) in enumerate(unique_cells):
+            candidate_ids, candidate_lats, candidate_lons = \
+                self._candidate_arrays((int(x), int(y)))
+            if not len(candidate_ids):
+                continue
+            points = valid[order[bounds[k]:bounds[k + 1]]]
+            point_lats = lat_radians[points, None]
+            point_lons = lon_radians[points, None]
+            # Haversine distance from every point to every candidate.
+            a = (np.sin((candidate_lats - point_lats) / 2) ** 2 +
+                 np.cos(point_lats) * np.cos(candidate_lats) *
+                 np.sin((candidate_lons - point_lons) / 2) ** 2)
+            cell_distances = 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+            closest = cell_distances.argmin(axis=1)
+            closest_distances = cell_distances[np.arange(len(points)), closest]
+            within = closest_distances < self.max_distance
+            location_ids[points[within]] = candidate_ids[closest[within]]
+            distances[points[within]] = closest_distances[within]
+        return location_ids, distances
 
     def resolve_tweet(self, tweet):
-        # 
-        # Update for APIv2: the coordinates are in the field
-        #       data->geo->coordinates->coordinates
-        # if they exist. The coordinates is a list with size 2.
-        # 
-        # The Twitter API allows tweet['coordinates'] to both be absent
-        # and None, such that the key exists but has a None value.
-        # "tweet.get('coordinates', {})" would return None in the latter
-        # case, with None.get() in turn causing an AttributeError. (None
-        # or {}), on the other hand, is {}, and {}.get() is okay.
-        data = tweet.get('data')
-        if data is None:
-            # API v1
-            v2 = False
-            tweet_coordinates = (tweet.get('coordinates') or {}).get('coordinates')
-        else:
-            # API v2
-            v2 = True
-            if isinstance(data, list):
-                data = data[0] # Jack 12/12/22: it seems the API changed again. Now actual data is dict in a list
-            geo = data.get('geo') or {}
-            tweet_coordinates = (geo.get('coordinates') or {}).get('coordinates')
-
-        if not tweet_coordinates:
-            if v2:
-                # Works in v2
-                # Enhancement (Jack 09/15/21): another way to get coordinates is from 
-                #       includes->places->[0]->geo->bbox
-                # the bbox is a list of four coordinates. 
-                # Avg 0 and 2 to get 1st coord, and avg 1 & 3 to get the 2nd 
-                places = tweet.get('includes', {}).get('places', None)
-                if not places:
-                    return None
-                place = places[0]
-                bbox = place.get('geo', {}).get('bbox')
-                if not bbox:
-                    return None
-                float_coords = [
-                    (float(bbox[0])+float(bbox[2]))/2,
-                    (float(bbox[1])+float(bbox[3]))/2
-                ]
-                tweet_coordinates = [
-                    float(f"{float_coords[0]:.7f}"), 
-                    float(f"{float_coords[1]:.7f}")
-                ]
-            else:
-                # v1:
-                #       place->bounding_box->coordinates->[0]->a list of lists of len 2 (long, lat)
-                coords = safe_get(safe_get(tweet, 'place'), 'bounding_box').get('coordinates')
-                # coords = tweet.get('place', {}).get('bounding_box', {}).get('coordinates', None)
-                if not coords:
-                    return None
-                coords = coords[0]
-                coords = [[float(el) for el in ls] for ls in coords]
-                # list(zip(*[[1,2],[3,4],[5,6]])) -> [(1, 3, 5), (2, 4, 6)]
-                coords_transform = list(zip(*coords))
-                coords_avg = [sum(el)/len(el) for el in coords_transform]
-                assert len(coords_avg) == 2
-        if tweet_coordinates is None: return
+        return self.resolve_geo(extract_geo(tweet))
+
+    def resolve_geo(self, geo):
+        # Use the tweet's own coordinates if it has them, or else the
+        # center of its Place's bounding box.
+        tweet_coordinates = geo.point
+        if tweet_coordinates is None:
+            return None
         tweet_coordinates = Point(longitude=tweet_coordinates[0],
                                   latitude=tweet_coordinates[1])
         closest_candidate = None
         closest_distance = float('inf')
-        for candidate in self.location_map[self._cell_for(tweet_coordinates.latitude,tweet_coordinates.longitude)].values():
+        for candidate in self.location_map.get(self._cell_for(tweet_coordinates.latitude,tweet_coordinates.longitude), {}).values():
             candidate_coordinates = Point(
                 candidate.latitude, candidate.longitude)
             distance = geopy_distance(
@@ -117,5 +178,7 @@ class GeocodeResolver(AbstractResolver):
                 closest_candidate = candidate
                 closest_distance = distance
         if closest_distance < self.max_distance:
-            return (False, closest_candidate)
+            return Resolution(
+                closest_candidate, score=closest_distance,
+                confidence=self.distance_confidence(closest_distance))
         return None
@@ -1,16 +1,29 @@
 """Resolvers based on Twitter Places."""
 from collections import defaultdict
-from itertools import count
+from itertools import chain, count
 import re
-import warnings
+import threading
 
-from ..location import Location, EARTH
+from .. import diagnostics
+from ..extract import extract_geo
+from ..location import Location, LEVELS
 from ..names import ALTERNATIVE_COUNTRY_NAMES, US_STATE_ABBREVIATIONS, COUNTRY_CODES
-from ..resolver import AbstractResolver, register
+from ..resolver import AbstractResolver, Resolution, register
+from ..rtree import STRtree
 
 
 STATE_RE = re.compile(r'.+,\s*(\w+)')
 
+BOUNDING_BOX_LEVELS = {
+    'poi': 'city',
+    'neighborhood': 'city',
+    'city': 'city',
+    'admin': 'state',
+    'country': 'country',
+}
+"""Maps Place types to the levels of the known locations that their
+bounding boxes are matched against."""
+
 
 @register('place')
 class PlaceResolver(AbstractResolver):
@@ -18,19 +31,157 @@ class PlaceResolver(AbstractResolver):
     information with a known location.  If *allow_unknown_locations* is
     True, unknown Places are added as new locations.  Otherwise, if
     *resolve_to_known_ancestor* is True, tweets with unknown Places will
-    be resolved to the nearest known location containing that Place."""
+    be resolved to the nearest known location containing that Place.
+
+    If *use_bounding_box* is True, tweets whose Places match no known
+    location by name are next resolved by the Place's bounding box: the
+    known location at the Place's level (city, state or country) whose
+    coordinates fall within the box, closest to its center, is returned.
+    If there is none, the most specific location within the box at a
+    coarser level is returned as a provisional resolution.  Only if
+    neither is found are less specific names tried.
+
+    The name tables used by carmen seq2seq (:py:attr:`s2s_names` and
+    :py:attr:`valid_names`) are built from the known locations the
+    first time they are used.  If *seq2seq* is True, they are instead
+    built up front and kept up to date as locations are added.
+
+    Resolutions by exact name have confidence 1.  A match by bounding
+    box has confidence 0.8 at the Place's own level and 0.5 at a
+    coarser one; a match after dropping the city name has confidence
+    0.7, and after also dropping the state name, 0.6; and a known
+    ancestor has confidence 0.4."""
+
+    geo_fields = ('has_place', 'apiv2', 'bbox', 'place_id', 'place_url',
+                  'place_type', 'place_name', 'place_full_name',
+                  'place_country')
+    required_fields = ('has_place',)
 
     _unknown_id_start = 1000000
 
     def __init__(self,
                  allow_unknown_locations=False,
-                 resolve_to_known_ancestor=False):
+                 resolve_to_known_ancestor=False,
+                 seq2seq=False,
+                 use_bounding_box=False):
         self.allow_unknown_locations = allow_unknown_locations
         self.resolve_to_known_ancestor = resolve_to_known_ancestor
+        self.use_bounding_box = use_bounding_box
+        # An (R-tree, locations) pair over the known locations'
+        # coordinates, or None until first needed.
+        self._spatial_index = None
         self._locations_by_name = {}
         self._unknown_ids = count(self._unknown_id_start)
-        self._valid_names = {'country': set(), 'state': set(), 'county': set(), 'city': set(), 'countrycode': set()}
-        self.s2s_names = set()
+        # Held while adding unknown locations during resolution and
+        # while building the tables derived from _locations_by_name, so
+        # that a table built by one thread cannot miss a location added
+        # by another.
+        self._update_lock = threading.Lock()
+        # A (valid_names, s2s_names) pair, or None until first needed.
+        self._seq2seq_tables = self._empty_seq2seq_tables() if seq2seq else None
+
+    @staticmethod
+    def _empty_seq2seq_tables():
+        return ({'country': set(), 'state': set(), 'county': set(), 'city': set(), 'countrycode': set()},
+                set())
+
+    @staticmethod
+    def _add_seq2seq_names(tables, location):
+        valid_names, s2s_names = tables
+        # jack added 11/13/22
+        for name_type, name in zip(['country', 'state', 'county', 'city'], list(location.canonical())):
+            valid_names[name_type].add(name)
+        if location.countrycode is not None:
+            valid_names['countrycode'].add(location.countrycode.lower())
+        s2s_names.update(location.s2s_name())
+
+    def _get_seq2seq_tables(self):
+        tables = self._seq2seq_tables
+        if tables is None:
+            # Build the tables in one pass and publish them with a
+            # single assignment, so concurrent readers never see them
+            # half built.
+            # The registry also holds locations whose names are shadowed
+            # in _locations_by_name by a later location.
+            with self._update_lock:
+                tables = self._seq2seq_tables
+                if tables is None:
+                    tables = self._empty_seq2seq_tables()
+                    for location in chain(self.registry.locations(),
+                                          list(self._locations_by_name.values())):
+                        self._add_seq2seq_names(tables, location)
+                    self._seq2seq_tables = tables
+        return tables
+
+    @property
+    def valid_names(self):
+        """A dictionary mapping each name type (``'country'``,
+        ``'state'``, ``'county'``, ``'city'`` and ``'countrycode'``) to
+        the set of known lowercase names of that type."""
+        return self._get_seq2seq_tables()[0]
+
+    _valid_names = valid_names
+
+    @property
+    def s2s_names(self):
+        """The set of known location names in carmen seq2seq format; see
+        :py:meth:`.Location.s2s_name`."""
+        return self._get_seq2seq_tables()[1]
+
+    def _get_spatial_index(self):
+        index = self._spatial_index
+        if index is None:
+            with self._update_lock:
+                index = self._spatial_index
+                if index is None:
+                    locations = {}
+                    for location in chain(self.registry.locations(),
+                                          list(self._locations_by_name.values())):
+                        if location.latitude or location.longitude:
+                            locations[id(location)] = location
+                    locations = list(locations.values())
+                    tree = STRtree([(location.longitude, location.latitude,
+                                     location.longitude, location.latitude)
+                                    for location in locations])
+                    index = self._spatial_index = (tree, locations)
+        return index
+
+    def _find_by_bbox(self, bbox, level, country):
+        """Return a :py:class:`.Resolution` of the known location best
+        matching a Place at *level* with bounding box
+        *bbox* in *country*, or None if the box contains no known
+        location at that level or a coarser one."""
+        west, south, east, north = bbox
+        if west > east:
+            # The box crosses the antimeridian.
+            return None
+        tree, locations = self._get_spatial_index()
+        target = LEVELS.index(level)
+        # Locations more specific than the Place cannot stand for it.
+        candidates = [
+            location for location in
+            (locations[i] for i in tree.query_box(west, south, east, north))
+            if LEVELS.index(location.level() or 'country') <= target]
+        same_country = [location for location in candidates
+                        if (location.country or '').lower() == country]
+        candidates = same_country or candidates
+        if not candidates:
+            return None
+        center_x, center_y = (west + east) / 2, (south + north) / 2
+
+        def key(location):
+            # Prefer the Place's own level, then the most specific
+            # coarser level, and then the location closest to the center
+            # of the box.
+            distance = ((location.longitude - center_x) ** 2 +
+                        (location.latitude - center_y) ** 2)
+            return (target - LEVELS.index(location.level() or 'country'),
+                    distance)
+
+        best = min(candidates, key=key)
+        if best.level() != level:
+            return Resolution(best, provisional=True, confidence=0.5)
+        return Resolution(best, confidence=0.8)
 
     def _find_by_location(self, location):
         return self._locations_by_name.get(location.canonical())
@@ -40,12 +191,12 @@ class PlaceResolver(AbstractResolver):
 
     def add_location(self, location):
         self._locations_by_name[location.canonical()] = location
-        # jack added 11/13/22
-        for name_type, name in zip(['country', 'state', 'county', 'city'], list(location.canonical())):
-            self._valid_names[name_type].add(name)
-        if location.countrycode is not None:
-            self._valid_names['countrycode'].add(location.countrycode.lower())
-        self.s2s_names.update(location.s2s_name())
+        # Only locations with coordinates are in the spatial index, and
+        # unknown Places added while resolving have none.
+        if location.latitude or location.longitude:
+            self._spatial_index = None
+        if self._seq2seq_tables is not None:
+            self._add_seq2seq_names(self._seq2seq_tables, location)
 
         # jack added 11/6/22
         # country, state, county, city = location.canonical()
@@ -53,25 +204,44 @@ class PlaceResolver(AbstractResolver):
         # self._locations_by_name[canonical_wo_state] = location
         # end 11/6/22
 
+    def remove_location(self, location):
+        key = location.canonical()
+        if self._locations_by_name.get(key) is location:
+            del self._locations_by_name[key]
+            if location.latitude or location.longitude:
+                self._spatial_index = None
+            # Other locations may share the removed location's names,
+            # so rebuild the seq2seq tables when next needed rather
+            # than editing them.
+            self._seq2seq_tables = None
+
+    def copy(self, layered=False):
+        clone = super(PlaceResolver, self).copy(layered)
+        # The seq2seq tables are changed in place by add_location, and
+        # hold every known name, so rather than copying them, let the
+        # copy rebuild them when next needed, as after a removal.
+        clone._seq2seq_tables = None
+        clone._update_lock = threading.Lock()
+        return clone
+
+    def merge_layers(self):
+        # Unknown locations may be added while the tables are merged.
+        with self._update_lock:
+            super(PlaceResolver, self).merge_layers()
+
     def resolve_tweet(self, tweet):
-        apiv2 = 'data' in tweet
-        if apiv2:
-            # API v2
-            places = tweet.get('includes', {}).get('places', None)
-            if not places:
-                return
-            place = places[0]
-        else:
-            # API v1
-            place = tweet.get('place', None)
-            if not place:
-                return
-        place_type = place['place_type'].lower()
+        return self.resolve_geo(extract_geo(tweet))
+
+    def resolve_geo(self, geo):
+        if not geo.has_place:
+            return None
+        place_type = (geo.place_type or '').lower()
         if place_type != 'seq2seq':
             # only infer country here if not using seq2seq
-            country = place.get('country', None)
+            country = geo.place_country
             if not country:
-                warnings.warn('Tweet has Place with no country')
+                diagnostics.report('place_without_country',
+                                   'Tweet has Place with no country')
                 return None
             country = ALTERNATIVE_COUNTRY_NAMES.get(country.lower(), country)
 
@@ -80,7 +250,7 @@ class PlaceResolver(AbstractResolver):
         if place_type == 'seq2seq':
             # special type: formatted place object string used by carmen seq2seq
             name = {}
-            constituents = [el.strip().lower() for el in place['full_name'].split(', ')]
+            constituents = [el.strip().lower() for el in (geo.place_full_name or '').split(', ')]
             if len(constituents) != 3:
                 # invalid generation
                 return None
@@ -94,18 +264,19 @@ class PlaceResolver(AbstractResolver):
             if city != '<city>':
                 name['city'] = city
         elif place_type in ('neighborhood', 'poi'):
-            full_name = place['full_name']
+            full_name = geo.place_full_name
             if full_name:
                 split_full_name = full_name.split(',')
                 if len(split_full_name) > 1:
                     name['city'] = split_full_name[-1]
             else:
-                warnings.warn('Tweet has Place with no neighborhood or '
-                              'point of interest full name')
+                diagnostics.report('place_without_full_name',
+                                   'Tweet has Place with no neighborhood or '
+                                   'point of interest full name')
         elif place_type == 'city':
-            name['city'] = place['name']
+            name['city'] = geo.place_name
             if country.lower() == 'united states':
-                full_name = place['full_name']
+                full_name = geo.place_full_name
                 if full_name:
                     # Attempt to extract a state name from the full_name.
                     match = STATE_RE.search(full_name)
@@ -113,58 +284,74 @@ class PlaceResolver(AbstractResolver):
                         state = match.group(1).lower()
                         name['state'] = US_STATE_ABBREVIATIONS.get(state)
                 else:
-                    warnings.warn('Tweet has Place with no city full name')
+                    diagnostics.report('place_without_full_name',
+                                       'Tweet has Place with no city full name')
         elif place_type == 'admin':
-            name['state'] = place['name']
+            name['state'] = geo.place_name
         elif place_type == 'country':
             pass
         else:
-            warnings.warn('Tweet has unknown place type "%s"' % place_type)
+            diagnostics.report('unknown_place_type',
+                               'Tweet has unknown place type "%s"' % place_type)
             return None
 
         location = self._find_by_name(**name)
         if location:
             return (False, location)
-        
+
+        if (self.use_bounding_box and geo.bbox is not None and
+                place_type in BOUNDING_BOX_LEVELS):
+            resolution = self._find_by_bbox(
+                geo.bbox, BOUNDING_BOX_LEVELS[place_type],
+                (name.get('country') or '').lower())
+            if resolution:
+                return resolution
+
         # try without city
         name['city'] = ''
         location = self._find_by_name(**name)
         if location:
-            return (False, location)
+            return Resolution(location, confidence=0.7)
 
         # try without city and state
         name['state'] = ''
         location = self._find_by_name(**name)
         if location:
-            return (False, location)
+            return Resolution(location, confidence=0.6)
         # breakpoint()
-        if apiv2:
+        if geo.apiv2:
             # NOTE: In APIv2, places don't have an url anymore
             location = Location(
-                id=next(self._unknown_ids),twitter_id=place['id'],
+                id=next(self._unknown_ids),twitter_id=geo.place_id,
                 **name)
         else:
             location = Location(
                 id=next(self._unknown_ids),
-                twitter_url=place['url'], twitter_id=place['id'],
+                twitter_url=geo.place_url, twitter_id=geo.place_id,
                 **name)
 
         # TODO: don't need this anymore. Test to make sure no error
         if self.allow_unknown_locations:
-            # Remember this location for future lookups.
-            self.add_location(location)
+            # Remember this location for future lookups.  Other threads
+            # may be resolving with this resolver meanwhile.
+            with self._update_lock:
+                self.add_location(location)
             return (False, location)
 
         # TODO: get rid of this
         if self.resolve_to_known_ancestor:
-            ancestor = location
-            while True:
-                ancestor = ancestor.parent()
-                if ancestor == EARTH:
-                    break
-                known_ancestor = self._find_by_location(ancestor)
+            # Walk up the names of the location's ancestors, as given by
+            # Location.parent(), by blanking the most specific name at
+            # each step, ending with EARTH.
+            name = location.canonical()
+            for depth in range(len(name) - 1, -1, -1):
+                if not name[depth]:
+                    continue
+                name = name[:depth] + ('',) * (len(name) - depth)
+                known_ancestor = self._locations_by_name.get(name)
                 if known_ancestor:
-                    return (True, known_ancestor)
+                    return Resolution(known_ancestor, provisional=True,
+                                      confidence=0.4)
         return None
 
         # TODO: try to find state or country if can't find city
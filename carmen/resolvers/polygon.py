@@ -0,0 +1,230 @@
+"""Resolvers based on administrative boundary polygons."""
+
+import json
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from ..extract import extract_geo
+from ..io import open_file
+from ..location import LEVELS
+from ..resolver import AbstractResolver, register
+from ..rtree import STRtree
+
+
+def _read_geojson(path):
+    with open_file(path, 'rb') as input:
+        collection = json.loads(input.read().decode('utf-8'))
+    for feature in collection.get('features', []):
+        yield feature.get('properties') or {}, feature.get('id'), feature.get('geometry')
+
+
+def _read_shapefile(path):
+    try:
+        import shapefile
+    except ImportError:
+        raise ImportError('reading shapefiles requires the pyshp package')
+    reader = shapefile.Reader(path)
+    for shape_record in reader.iterShapeRecords():
+        yield (shape_record.record.as_dict(), None,
+               shape_record.shape.__geo_interface__)
+
+
+CONTAINS_CHUNK_SIZE = 1 << 20
+"""The largest number of (point, edge) pairs :py:meth:`Boundary.contains`
+tests at once, which bounds the size of its temporary arrays."""
+
+
+def _rings(geometry):
+    """Yield the rings of a GeoJSON Polygon or MultiPolygon *geometry*
+    as ``(points, hole)`` pairs, where *points* is a list of (x, y)
+    points and *hole* is True for the inner rings of a polygon."""
+    geometry_type = geometry.get('type')
+    if geometry_type == 'Polygon':
+        polygons = [geometry['coordinates']]
+    elif geometry_type == 'MultiPolygon':
+        polygons = geometry['coordinates']
+    else:
+        return
+    for polygon in polygons:
+        for i, ring in enumerate(polygon):
+            if len(ring) >= 3:
+                yield ring, i > 0
+
+
+class Boundary(object):
+    """The boundary of the known location with ID *location_id*, given
+    as edges between consecutive points of its *rings*, ``(points,
+    hole)`` pairs as yielded by :py:func:`_rings`.  Holes and multiple
+    parts are handled by the even-odd rule.  The boundary's *area*, in
+    square degrees, is that of its outer rings less that of its
+    holes."""
+
+    __slots__ = ('location_id', 'bounds', 'area', 'x1', 'y1', 'x2', 'y2')
+
+    def __init__(self, location_id, rings):
+        self.location_id = location_id
+        starts, ends = [], []
+        area = 0.0
+        for ring, hole in rings:
+            points = np.asarray(ring, dtype=float)[:, :2]
+            following = np.roll(points, -1, axis=0)
+            starts.append(points)
+            ends.append(following)
+            # The shoelace formula.
+            ring_area = abs(np.sum(points[:, 0] * following[:, 1] -
+                                   following[:, 0] * points[:, 1])) / 2
+            area += -ring_area if hole else ring_area
+        starts = np.concatenate(starts)
+        ends = np.concatenate(ends)
+        self.x1, self.y1 = starts[:, 0], starts[:, 1]
+        self.x2, self.y2 = ends[:, 0], ends[:, 1]
+        min_x, min_y = starts.min(axis=0)
+        max_x, max_y = starts.max(axis=0)
+        self.bounds = (float(min_x), float(min_y), float(max_x), float(max_y))
+        self.area = max(area, 0.0)
+
+    def contains(self, xs, ys):
+        """Return a boolean array indicating which of the points given
+        by the arrays *xs* and *ys* lie inside this boundary."""
+        xs = np.asarray(xs, dtype=float)
+        ys = np.asarray(ys, dtype=float)
+        inside = np.zeros(len(xs), dtype=bool)
+        # Test the points in chunks, so that the arrays of points by
+        # edges stay small however many points and edges there are.
+        chunk_size = max(1, CONTAINS_CHUNK_SIZE // len(self.x1))
+        for start in range(0, len(xs), chunk_size):
+            chunk_xs = xs[start:start + chunk_size, None]
+            chunk_ys = ys[start:start + chunk_size, None]
+            # Cast a ray from each point towards +x and count the edges
+            # it crosses.
+            straddles = (self.y1 > chunk_ys) != (self.y2 > chunk_ys)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                crossing_x = (self.x1 + (chunk_ys - self.y1) *
+                              (self.x2 - self.x1) / (self.y2 - self.y1))
+            crossings = np.count_nonzero(straddles & (chunk_xs < crossing_x),
+                                         axis=1)
+            inside[start:start + chunk_size] = crossings % 2 == 1
+        return inside
+
+
+def _specificity(location):
+    """Return a number that is larger for more specific locations."""
+    return LEVELS.index(location.level() or 'country')
+
+
+@register('polygon')
+class PolygonResolver(AbstractResolver):
+    """A resolver that locates a tweet by finding the known locations
+    whose boundaries contain the tweet's coordinates, and returning the
+    most specific of them.
+
+    Boundaries are read from *boundaries*, a GeoJSON file of Polygon and
+    MultiPolygon features (optionally gzipped) or, if the pyshp package
+    is installed, a shapefile.  Each feature is matched to a known
+    location by the ID in its *id_property* property, or failing that
+    the feature's own ID.  Candidate boundaries are found with a packed
+    R-tree of their bounding boxes, with up to *node_capacity* entries
+    per node."""
+
+    name = 'polygon'
+    geo_fields = ('coordinates',)
+
+    def __init__(self, boundaries=None, id_property='id', node_capacity=16):
+        if np is None:
+            raise ImportError('the polygon resolver requires NumPy; install '
+                              'it with "pip install carmen[polygon]"')
+        if boundaries is None:
+            raise ValueError('the polygon resolver requires a boundaries file')
+        if str(boundaries).lower().endswith('.shp'):
+            features = _read_shapefile(boundaries)
+        else:
+            features = _read_geojson(boundaries)
+        self.boundaries = []
+        for i, (properties, feature_id, geometry) in enumerate(features):
+            location_id = properties.get(id_property, feature_id)
+            rings = list(_rings(geometry or {}))
+            if location_id is None or not rings:
+                continue
+            try:
+                location_id = int(location_id)
+            except (TypeError, ValueError):
+                raise ValueError(
+                    'feature {0} of {1} has location ID {2!r}, which is not '
+                    'a number; set id_property to the property holding the '
+                    'IDs of known locations'.format(i, boundaries, location_id))
+            self.boundaries.append(Boundary(location_id, rings))
+        self._tree = STRtree([boundary.bounds for boundary in self.boundaries],
+                             node_capacity=node_capacity)
+
+    def add_location(self, location):
+        # Boundaries are keyed by location ID and looked up in the
+        # registry, so there is nothing to index.
+        pass
+
+    def remove_location(self, location):
+        pass
+
+    def _best(self, candidates):
+        """Return the most specific known location among the
+        boundaries with indexes in *candidates*, preferring smaller
+        boundaries between locations at the same level."""
+        best, best_key = None, None
+        for i in candidates:
+            boundary = self.boundaries[i]
+            location = self.registry.get(boundary.location_id)
+            if location is None:
+                continue
+            key = (_specificity(location), -boundary.area)
+            if best_key is None or key > best_key:
+                best, best_key = location, key
+        return best
+
+    def resolve_tweet(self, tweet):
+        return self.resolve_geo(extract_geo(tweet))
+
+    def resolve_geo(self, geo):
+        if geo.coordinates is None:
+            return None
+        longitude, latitude = geo.coordinates
+        containing = [
+            i for i in self._tree.query_point(longitude, latitude)
+            if self.boundaries[i].contains([longitude], [latitude])[0]]
+        location = self._best(containing)
+        if location is None:
+            return None
+        return (False, location)
+
+    def resolve_coordinates(self, latitudes, longitudes):
+        """Resolve many coordinates at once, as for
+        :py:meth:`.GeocodeResolver.resolve_coordinates`.  Return a NumPy
+        array of the ID of the most specific known location containing
+        each point, or ``-1`` where there is none.
+
+        Candidate boundaries are found for every point first, and then
+        each boundary is tested against all of its candidate points in
+        one vectorized step."""
+        latitudes = np.asarray(latitudes, dtype=float).ravel()
+        longitudes = np.asarray(longitudes, dtype=float).ravel()
+        if latitudes.shape != longitudes.shape:
+            raise ValueError('latitudes and longitudes must have the same length')
+        points_by_boundary = {}
+        for point, (latitude, longitude) in enumerate(zip(latitudes, longitudes)):
+            if np.isfinite(latitude) and np.isfinite(longitude):
+                for i in self._tree.query_point(longitude, latitude):
+                    points_by_boundary.setdefault(i, []).append(point)
+        containing = [[] for _ in range(len(latitudes))]
+        for i, points in points_by_boundary.items():
+            points = np.asarray(points)
+            inside = self.boundaries[i].contains(longitudes[points], latitudes[points])
+            for point in points[inside]:
+                containing[point].append(i)
+        location_ids = np.full(latitudes.shape, -1, dtype=np.int64)
+        for point, candidates in enumerate(containing):
+            if candidates:
+                location = self._best(candidates)
+                if location is not None:
+                    location_ids[point] = location.id
+        return location_ids
@@ -3,12 +3,15 @@
 
 import re
 
+from ..extract import extract_geo
+from ..fuzzy import DeletionIndex
 from ..names import *
-from ..resolver import AbstractResolver, register
+from ..resolver import AbstractResolver, Resolution, register
 
 
 STATE_RE = re.compile(r'.+,\s*(\w+)')
 NORMALIZATION_RE = re.compile(r'\s+|\W')
+NORMALIZATION_WITH_COMMAS_RE = re.compile(r'\s+|[^\w,]')
 
 # carmen seq2seq
 LOCATION_SPECIAL_TOKENS = ["<CITY>", "<ADMIN>", "<COUNTRY>"]
@@ -23,22 +26,81 @@ def normalize(location_name, preserve_commas=False):
     """
     for token in LOCATION_SPECIAL_TOKENS:
         location_name = location_name.replace(token, '')
-    def replace(match):
-        if preserve_commas and ',' in match.group(0):
-            return ','
-        return ' '
-    return NORMALIZATION_RE.sub(replace, location_name).strip().lower()
+    # A comma is never part of a run of whitespace, so leaving commas
+    # out of the pattern is the same as replacing them with themselves.
+    if preserve_commas:
+        pattern = NORMALIZATION_WITH_COMMAS_RE
+    else:
+        pattern = NORMALIZATION_RE
+    return pattern.sub(' ', location_name).strip().lower()
+
+
+_py_normalize = normalize
+
+try:
+    from .._speedups import normalize
+except ImportError:
+    pass
 
 
 @register('profile')
 class ProfileResolver(AbstractResolver):
     """A resolver that locates a tweet by matching the tweet author's
-    profile location against known locations."""
+    profile location against known locations.
+
+    If *fuzzy* is True, profile locations that match no known name
+    exactly are matched against the closest known name within
+    *fuzzy_max_distance* edits (see :py:mod:`carmen.fuzzy`), provided
+    they are at least *fuzzy_min_length* characters long.  Such matches
+    are provisional.  The fuzzy index is built when first needed; its
+    estimated size is kept within *fuzzy_memory_mb* megabytes, if given,
+    by indexing shorter name prefixes.
+
+    If *lookup_table* is the path of a table built by
+    :py:mod:`carmen.lookup`, profile locations are first looked up
+    there verbatim, and only strings missing from the table are
+    normalized and matched.  The table should be built with the same
+    location database and options as this resolver.
+
+    Exact matches of the whole profile location have confidence 1, and
+    matches of a state or country name after its last comma, 0.8.  Fuzzy
+    matches *d* edits away have confidence
+    ``0.5 * (1 - d / (fuzzy_max_distance + 1))``."""
 
     name = 'profile'
+    geo_fields = ('profile_location',)
 
-    def __init__(self):
+    def __init__(self, fuzzy=False, fuzzy_max_distance=2,
+                 fuzzy_min_length=4, fuzzy_prefix_length=7,
+                 fuzzy_memory_mb=None, lookup_table=None):
         self.location_name_to_location = {}
+        self.fuzzy = fuzzy
+        self.fuzzy_max_distance = int(fuzzy_max_distance)
+        self.fuzzy_min_length = int(fuzzy_min_length)
+        self.fuzzy_prefix_length = int(fuzzy_prefix_length)
+        self.fuzzy_memory_mb = fuzzy_memory_mb
+        self._fuzzy_index = None
+        self.lookup_table = None
+        if lookup_table is not None:
+            from ..lookup import LookupTable
+            self.lookup_table = LookupTable(lookup_table)
+
+    def _get_fuzzy_index(self):
+        index = self._fuzzy_index
+        if index is None:
+            # Queries are normalized, so only normalized names can
+            # match them.
+            names = [name for name in list(self.location_name_to_location)
+                     if normalize(name) == name]
+            memory_budget = None
+            if self.fuzzy_memory_mb is not None:
+                memory_budget = float(self.fuzzy_memory_mb) * 1024 * 1024
+            index = DeletionIndex(
+                names, max_distance=self.fuzzy_max_distance,
+                prefix_length=self.fuzzy_prefix_length,
+                memory_budget=memory_budget)
+            self._fuzzy_index = index
+        return index
 
     def add_location(self, location):
         aliases = list(location.aliases)
@@ -60,17 +122,45 @@ class ProfileResolver(AbstractResolver):
             if normalized != alias and normalized not in aliases:
                 aliases.append(normalized)
             aliases_already_added.add(alias)
+        self._fuzzy_index = None
+
+    def remove_location(self, location):
+        aliases = list(location.aliases)
+        for alias in aliases:
+            if self.location_name_to_location.get(alias) is location:
+                del self.location_name_to_location[alias]
+            normalized = normalize(alias)
+            if normalized != alias and normalized not in aliases:
+                aliases.append(normalized)
+        self._fuzzy_index = None
 
     def resolve_tweet(self, tweet):
-        location_string = tweet.get('user', {}).get('location', '')
-            
+        return self.resolve_geo(extract_geo(tweet))
+
+    def resolve_geo(self, geo):
+        location_string = geo.profile_location
         if not location_string:
             return None
+        if self.lookup_table is not None:
+            entry = self.lookup_table.get(location_string)
+            if entry is not None:
+                provisional, location_id, confidence = entry
+                if location_id < 0:
+                    return None
+                location = self.registry.get(location_id)
+                if location is not None:
+                    return Resolution(location, provisional=provisional,
+                                      confidence=confidence)
+        return self.resolve_string(location_string)
 
-        normalized = normalize(location_string)
-
-        if normalized in self.location_name_to_location:
-            return (False, self.location_name_to_location[normalized])
+    def resolve_string(self, location_string):
+        """Resolve the profile location *location_string*, returning
+        the same as :py:meth:`resolve_tweet` would for a tweet with that
+        profile location."""
+        normalized = plain_normalized = normalize(location_string)
+        location = self.location_name_to_location.get(normalized)
+        if location is not None:
+            return (False, location)
         # Try again with commas.
         normalized = normalize(location_string, preserve_commas=True)
         match = STATE_RE.search(normalized)
@@ -84,5 +174,16 @@ class ProfileResolver(AbstractResolver):
             elif after_comma in COUNTRY_CODES:
                 location_name = COUNTRY_CODES[after_comma]
             if location_name in self.location_name_to_location:
-                return (False, self.location_name_to_location[location_name])
+                return Resolution(self.location_name_to_location[location_name],
+                                  confidence=0.8)
+        if self.fuzzy:
+            normalized = plain_normalized
+            if len(normalized) >= self.fuzzy_min_length:
+                match = self._get_fuzzy_index().lookup(normalized)
+                if match is not None:
+                    location = self.location_name_to_location.get(match[0])
+                    if location is not None:
+                        return Resolution(
+                            location, provisional=True,
+                            confidence=0.5 - 0.5 * match[1] / (self.fuzzy_max_distance + 1))
         return None
@@ -1,11 +1,14 @@
 """Resolvers based on Twitter tweet time-zone data."""
 
+import datetime
+import pkgutil
 import sys
 import re
 import warnings
 
+from ..extract import extract_geo
 from ..names import *
-from ..resolver import AbstractResolver, register
+from ..resolver import AbstractResolver, Resolution, register
 
 
 timezone_to_location_id = {
@@ -101,29 +104,183 @@ timezone_to_location_id = {
 }
 
 
+def read_zone_table(zone_table=None):
+    """Yield a ``(country_code, zone_name)`` pair for each zone in the
+    IANA time zone table *zone_table* (in the format of ``zone.tab``),
+    or in the copy distributed with Carmen if *zone_table* is None."""
+    if zone_table is None:
+        contents = pkgutil.get_data('carmen', 'data/zone.tab').decode('ascii')
+    else:
+        with open(zone_table, 'rb') as input:
+            contents = input.read().decode('utf-8')
+    for line in contents.splitlines():
+        if not line.strip() or line.startswith('#'):
+            continue
+        fields = line.split('\t')
+        if len(fields) >= 3:
+            yield fields[0].upper(), fields[2]
+
+
+def zone_utc_offsets(zone_name, year=2017):
+    """Return the set of UTC offsets, in seconds, observed in the IANA
+    time zone *zone_name* in January and July of *year*, or None if
+    time zone data is unavailable."""
+    try:
+        from zoneinfo import ZoneInfo
+    except ImportError:
+        return None
+    try:
+        zone = ZoneInfo(zone_name)
+    except Exception:
+        return None
+    return set(
+        int(datetime.datetime(year, month, 15, 12, tzinfo=zone)
+            .utcoffset().total_seconds())
+        for month in (1, 7))
+
+
 @register('timezone')
 class TimezoneResolver(AbstractResolver):
     """
     A resolver that locates a tweet by using the tweet's time-zone to infer
     a location from a list of known locations.
+
+    Time zones are matched by the Rails-style names used by Twitter
+    (such as ``"Tokyo"``) and by IANA names (such as ``"Asia/Tokyo"``),
+    which are resolved to the country-level location of the zone's
+    country in *zone_table* (by default, a copy of the IANA
+    ``zone.tab``).  If *use_utc_offset* is True (it is False by
+    default), tweets whose time zone is missing or unknown are resolved
+    by their UTC offset if the offset is used in only one country; such
+    resolutions are provisional.
+    Since a time zone says little about where its user is, resolutions
+    by time zone name have confidence 0.5, and by UTC offset, 0.3.
+
+    The mapping from time zones to known locations is compiled, and
+    checked against the known locations, the first time it is needed;
+    see :py:meth:`coverage`.
     """
 
     name = 'timezone'
+    geo_fields = ('time_zone', 'utc_offset')
 
-    def __init__(self):
-        self.timezone_to_location = {}
+    def __init__(self, zone_table=None, use_utc_offset=False):
+        self.zone_table = zone_table
+        self.use_utc_offset = use_utc_offset
+        if not use_utc_offset:
+            # Tweets with only a UTC offset cannot be resolved.
+            self.required_fields = ('time_zone',)
+        # A (zone name -> location, UTC offset -> location, coverage)
+        # triple, or None until first needed.
+        self._index = None
 
     def add_location(self, location):
-        pass
+        self._index = None
+
+    def remove_location(self, location):
+        self._index = None
+
+    def set_registry(self, registry):
+        super(TimezoneResolver, self).set_registry(registry)
+        self._index = None
+
+    def _country_locations(self):
+        """Return a dictionary mapping upper-case country codes to
+        known country-level locations."""
+        by_name = {}
+        codes = {}
+        for location in self.registry.locations():
+            if location.level() == 'country':
+                by_name[location.country.lower()] = location
+            if location.countrycode and location.country:
+                codes.setdefault(location.countrycode.upper(),
+                                 location.country.lower())
+        for code, name in COUNTRY_CODES.items():
+            codes.setdefault(code.upper(), name)
+        countries = {}
+        for code, name in codes.items():
+            location = by_name.get(name)
+            if location is None:
+                location = by_name.get(ALTERNATIVE_COUNTRY_NAMES.get(name, name))
+            if location is not None:
+                countries[code] = location
+        return countries
+
+    def _build_index(self):
+        zones = {}
+        missing_names = []
+        for zone_name, location_id in timezone_to_location_id.items():
+            location = self.registry.get(location_id)
+            if location is None:
+                missing_names.append(zone_name)
+            else:
+                zones[zone_name] = location
+
+        countries = self._country_locations()
+        iana_zones = 0
+        missing_zones = []
+        zone_countries = {}
+        for country_code, zone_name in read_zone_table(self.zone_table):
+            zone_countries.setdefault(zone_name, country_code)
+            location = countries.get(country_code)
+            iana_zones += 1
+            if location is None:
+                missing_zones.append(zone_name)
+            else:
+                zones.setdefault(zone_name, location)
+
+        offsets = {}
+        if self.use_utc_offset:
+            # Only offsets observed in a single country identify it.
+            offset_countries = {}
+            for zone_name, country_code in zone_countries.items():
+                for offset in zone_utc_offsets(zone_name) or ():
+                    offset_countries.setdefault(offset, set()).add(country_code)
+            for offset, country_codes in offset_countries.items():
+                if len(country_codes) == 1:
+                    location = countries.get(next(iter(country_codes)))
+                    if location is not None:
+                        offsets[offset] = location
+
+        if missing_names:
+            warnings.warn(
+                '{0} of {1} time zone names refer to unknown locations'.format(
+                    len(missing_names), len(timezone_to_location_id)))
+        coverage = {
+            'twitter_names': len(timezone_to_location_id) - len(missing_names),
+            'twitter_names_total': len(timezone_to_location_id),
+            'twitter_names_missing': sorted(missing_names),
+            'iana_zones': iana_zones - len(missing_zones),
+            'iana_zones_total': iana_zones,
+            'iana_zones_missing': sorted(missing_zones),
+            'utc_offsets': len(offsets),
+        }
+        return zones, offsets, coverage
+
+    def _get_index(self):
+        index = self._index
+        if index is None:
+            index = self._index = self._build_index()
+        return index
+
+    def coverage(self):
+        """Return a dictionary describing how many Twitter time zone
+        names, IANA zones and UTC offsets could be mapped to known
+        locations, and which names and zones could not."""
+        return dict(self._get_index()[2])
 
     def resolve_tweet(self, tweet):
-        timezone = tweet.get('user', {}).get('time_zone')
-        if not timezone:
-            return None
-        if timezone not in timezone_to_location_id:
-            return None
-
-        location_id = timezone_to_location_id[timezone]
-        location = self.get_location_by_id(location_id)
-        return (False, location)
-        
\ No newline at end of file
+        return self.resolve_geo(extract_geo(tweet))
+
+    def resolve_geo(self, geo):
+        zones, offsets, _ = self._get_index()
+        timezone = geo.time_zone
+        if timezone:
+            location = zones.get(timezone)
+            if location is not None:
+                return Resolution(location, confidence=0.5)
+        if geo.utc_offset is not None:
+            location = offsets.get(geo.utc_offset)
+            if location is not None:
+                return Resolution(location, provisional=True, confidence=0.3)
+        return None
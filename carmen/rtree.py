@@ -0,0 +1,88 @@
+"""A static R-tree for finding boxes that contain a point or overlap a
+box.
+
+:py:class:`STRtree` is bulk-loaded with the Sort-Tile-Recursive
+algorithm: boxes are sorted into vertical slices by the x coordinates
+of their centers, each slice is sorted by y, and runs of
+*node_capacity* boxes become the leaves.  The leaves are packed into
+parent nodes the same way, and so on up to a single root.  Every node
+is full except the last in each level, so the tree is compact and
+shallow, and it is stored as flat per-level lists rather than node
+objects."""
+
+import math
+
+
+def _union(boxes):
+    return (min(box[0] for box in boxes), min(box[1] for box in boxes),
+            max(box[2] for box in boxes), max(box[3] for box in boxes))
+
+
+class STRtree(object):
+    """A packed R-tree over *boxes*, a sequence of ``(min_x, min_y,
+    max_x, max_y)`` tuples.  Queries return indexes into *boxes*."""
+
+    def __init__(self, boxes, node_capacity=16):
+        if node_capacity < 2:
+            raise ValueError('node_capacity must be at least 2')
+        self.node_capacity = node_capacity
+        # Each level is a pair of lists: the bounds of its entries, and
+        # for each entry either the index of a box (in the bottom
+        # level) or the (start, end) range of its children in the level
+        # below.  Levels are stored bottom first.
+        self._levels = []
+        entries = [(tuple(box), i) for i, box in enumerate(boxes)]
+        if not entries:
+            return
+        while True:
+            entries = self._sort_tile(entries)
+            self._levels.append(([bounds for bounds, _ in entries],
+                                 [payload for _, payload in entries]))
+            if len(entries) <= node_capacity:
+                break
+            entries = [
+                (_union([bounds for bounds, _ in entries[start:start + node_capacity]]),
+                 (start, min(start + node_capacity, len(entries))))
+                for start in range(0, len(entries), node_capacity)]
+
+    def _sort_tile(self, entries):
+        """Return *entries* in Sort-Tile-Recursive order."""
+        capacity = self.node_capacity
+        num_nodes = int(math.ceil(len(entries) / float(capacity)))
+        slice_size = capacity * int(math.ceil(math.sqrt(num_nodes)))
+        entries = sorted(entries, key=lambda entry: entry[0][0] + entry[0][2])
+        ordered = []
+        for start in range(0, len(entries), slice_size):
+            ordered.extend(sorted(entries[start:start + slice_size],
+                                  key=lambda entry: entry[0][1] + entry[0][3]))
+        return ordered
+
+    def __len__(self):
+        return len(self._levels[0][0]) if self._levels else 0
+
+    def query_box(self, min_x, min_y, max_x, max_y):
+        """Return the indexes of the boxes that overlap the given box
+        (including those that only touch it)."""
+        if not self._levels:
+            return []
+        results = []
+        top = len(self._levels) - 1
+        stack = [(top, 0, len(self._levels[top][0]))]
+        while stack:
+            level, start, end = stack.pop()
+            bounds, payloads = self._levels[level]
+            for i in range(start, end):
+                box = bounds[i]
+                if (box[0] <= max_x and min_x <= box[2] and
+                        box[1] <= max_y and min_y <= box[3]):
+                    if level == 0:
+                        results.append(payloads[i])
+                    else:
+                        child_start, child_end = payloads[i]
+                        stack.append((level - 1, child_start, child_end))
+        return results
+
+    def query_point(self, x, y):
+        """Return the indexes of the boxes that contain the point (*x*,
+        *y*)."""
+        return self.query_box(x, y, x, y)
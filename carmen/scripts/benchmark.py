@@ -0,0 +1,302 @@
+"""Benchmarks for Carmen.
+
+Usage::
+
+    python -m carmen.scripts.benchmark startup [--locations PATH]
+        [--order RESOLVERS ...] [--repeat N]
+
+    python -m carmen.scripts.benchmark workers [--locations PATH]
+        [--order RESOLVERS] [--workers N ...] [--chunk-size N]
+        tweets_path
+
+    python -m carmen.scripts.benchmark delta [--locations PATH]
+        [--order RESOLVERS] [--changes N] [--repeat N] tweets_path
+
+The ``startup`` benchmark measures cold-start time in fresh interpreter
+processes: the time to import Carmen and build a resolver for each
+resolver order, and the time to also load the location database.
+
+The ``workers`` benchmark resolves the same tweets with pools of
+threads (see :py:mod:`carmen.parallel`) and of processes, for each
+number of workers, and reports the time to set up each pool, the
+throughput, and the resident memory of the benchmark process (for
+threads) or of the worker processes.  Threads share one resolver; each
+process loads its own copy of the location database.  Both decode the
+tweets in the workers, and both produce results in input order.
+
+The ``delta`` benchmark measures
+:py:meth:`~carmen.resolver.ResolverCollection.apply_delta` with a delta
+updating the first *N* locations of the database, and the throughput of
+resolving the same tweets before the delta, with the layered tables a
+delta first builds (see :py:class:`carmen.layered.LayeredDict`), and
+after the delta, once the tables have been merged again.
+"""
+from __future__ import division, print_function
+
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+
+from carmen.io import open_file
+from carmen.progress import resident_memory
+
+
+STARTUP_SCRIPT = '''
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+start = time.time()
+import carmen
+resolver = carmen.get_resolver(order=%(order)r)
+built = time.time()
+if %(load)r:
+    resolver.load_locations(location_file=%(location_file)r)
+loaded = time.time()
+json.dump({'build': built - start, 'load': loaded - built,
+           'modules': len(sys.modules)}, sys.stdout)
+'''
+
+
+def time_startup(order, location_file, load):
+    """Start a new interpreter that builds a resolver with the given
+    *order*, and return the timings it reports."""
+    script = STARTUP_SCRIPT % {
+        'order': order, 'location_file': location_file, 'load': load}
+    output = subprocess.check_output([sys.executable, '-c', script])
+    return json.loads(output.decode('utf-8'))
+
+
+def startup(args):
+    orders = args.order or ['place,geocode,profile', 'profile', 'geocode']
+    print('%-24s %12s %12s %9s' % ('order', 'build (ms)', 'load (ms)', 'modules'))
+    for order in orders:
+        resolver_order = order.split(',')
+        build_times, load_times, modules = [], [], 0
+        for _ in range(args.repeat):
+            timings = time_startup(resolver_order, args.location_file,
+                                   not args.no_load)
+            build_times.append(timings['build'])
+            load_times.append(timings['load'])
+            modules = timings['modules']
+        print('%-24s %12.1f %12.1f %9d' % (
+            order, 1000 * statistics.median(build_times),
+            1000 * statistics.median(load_times), modules))
+
+
+_worker_resolver = None
+
+
+def _build_resolver(order, location_file):
+    import carmen
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        resolver = carmen.get_resolver(order=order)
+        resolver.load_locations(location_file=location_file)
+    return resolver
+
+
+def _init_worker(order, location_file):
+    global _worker_resolver
+    _worker_resolver = _build_resolver(order, location_file)
+
+
+def _resolve_lines(lines, resolver=None):
+    """Decode and resolve a chunk of input *lines*, returning the
+    resolved location IDs (None for unresolved tweets)."""
+    resolver = resolver or _worker_resolver
+    location_ids = []
+    for line in lines:
+        try:
+            tweet = json.loads(line)
+        except ValueError:
+            continue
+        if not isinstance(tweet, dict):
+            continue
+        resolution = resolver.resolve_tweet(tweet)
+        location_ids.append(resolution.location.id if resolution else None)
+    return location_ids
+
+
+def _process_memory(pool):
+    """Return the total resident memory of *pool*'s worker processes."""
+    total = 0
+    for process in getattr(pool, '_pool', ()):
+        try:
+            with open('/proc/%d/statm' % process.pid) as statm:
+                total += int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (IOError, OSError, IndexError, ValueError):
+            return None
+    return total
+
+
+def time_threads(lines, workers, order, location_file, chunk_size):
+    from carmen.parallel import imap_chunks
+    start = time.time()
+    resolver = _build_resolver(order, location_file)
+    ready = time.time()
+    results = list(imap_chunks(
+        lambda chunk: [_resolve_lines(chunk, resolver)], lines, workers,
+        chunk_size=chunk_size))
+    done = time.time()
+    return ready - start, done - ready, resident_memory(), results
+
+
+def time_processes(lines, workers, order, location_file, chunk_size):
+    from carmen.parallel import chunks
+    start = time.time()
+    pool = multiprocessing.Pool(workers, _init_worker, (order, location_file))
+    try:
+        # Wait for every worker to finish loading.
+        pool.map(_resolve_lines, [[]] * workers, chunksize=1)
+        ready = time.time()
+        results = list(pool.imap(_resolve_lines, chunks(lines, chunk_size)))
+        done = time.time()
+        memory = _process_memory(pool)
+    finally:
+        pool.close()
+        pool.join()
+    return ready - start, done - ready, memory, results
+
+
+def workers(args):
+    # Data-quality reports would only interleave with the table.
+    warnings.simplefilter('ignore')
+    with open_file(args.tweets_file, 'rb') as input:
+        lines = [line for line in input if line.strip()]
+    order = args.order.split(',') if args.order else None
+    print('%-10s %7s %10s %12s %10s' % (
+        'pool', 'workers', 'setup (s)', 'tweets/s', 'RSS (MB)'))
+    expected = None
+    for count in args.workers or [1, 2, 4]:
+        for kind, function in (('threads', time_threads),
+                               ('processes', time_processes)):
+            setup, elapsed, memory, results = function(
+                lines, count, order, args.location_file, args.chunk_size)
+            if expected is None:
+                expected = results
+            elif results != expected:
+                print('%s with %d workers gave different results' % (kind, count),
+                      file=sys.stderr)
+            print('%-10s %7d %10.2f %12.0f %10s' % (
+                kind, count, setup, len(lines) / elapsed if elapsed else 0,
+                '-' if memory is None else '%.0f' % (memory / 1048576)))
+
+
+def _throughput(resolver, tweets, repeat):
+    """Return the best rate, in tweets per second, at which *resolver*
+    resolves the decoded *tweets* over *repeat* runs."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for tweet in tweets:
+            resolver.resolve_tweet(tweet)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(tweets) / best if best else 0
+
+
+def delta(args):
+    from carmen.location import read_locations
+    warnings.simplefilter('ignore')
+    tweets = []
+    with open_file(args.tweets_file, 'rb') as input:
+        for line in input:
+            try:
+                tweet = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(tweet, dict):
+                tweets.append(tweet)
+    order = args.order.split(',') if args.order else None
+    resolver = _build_resolver(order, args.location_file)
+    with tempfile.NamedTemporaryFile('w', suffix='.json',
+                                     delete=False) as delta_file:
+        for i, fields in read_locations(args.location_file):
+            if i >= args.changes:
+                break
+            if fields is not None:
+                delta_file.write(json.dumps(fields) + '\n')
+    try:
+        before = _throughput(resolver, tweets, args.repeat)
+        layered = resolver.copy(layered=True)
+        during = _throughput(layered, tweets, args.repeat)
+        start = time.perf_counter()
+        resolver.apply_delta(delta_file.name)
+        elapsed = time.perf_counter() - start
+        after = _throughput(resolver, tweets, args.repeat)
+    finally:
+        os.unlink(delta_file.name)
+    print('apply_delta of %d locations: %.1f ms' % (args.changes,
+                                                    1000 * elapsed))
+    print('%-16s %12s' % ('tables', 'tweets/s'))
+    for label, rate in (('before delta', before), ('layered', during),
+                        ('after delta', after)):
+        print('%-16s %12.0f' % (label, rate))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark Carmen.')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    subparsers.required = True
+    startup_parser = subparsers.add_parser('startup',
+        help='measure cold-start time')
+    startup_parser.add_argument('--order', action='append',
+        metavar='RESOLVERS',
+        help='resolver order to measure (comma-separated); may be '
+             'repeated')
+    startup_parser.add_argument('--locations', metavar='PATH',
+        dest='location_file',
+        help='path to alternative location database')
+    startup_parser.add_argument('--no-load', action='store_true',
+        help='do not load the location database')
+    startup_parser.add_argument('--repeat', type=int, default=5,
+        help='number of runs per order (default: 5)')
+    startup_parser.set_defaults(run=startup)
+    workers_parser = subparsers.add_parser('workers',
+        help='compare pools of threads and processes')
+    workers_parser.add_argument('tweets_file', metavar='tweets_path',
+        help='file of tweets to resolve')
+    workers_parser.add_argument('--order', metavar='RESOLVERS',
+        help='resolver order (comma-separated)')
+    workers_parser.add_argument('--locations', metavar='PATH',
+        dest='location_file',
+        help='path to alternative location database')
+    workers_parser.add_argument('--workers', action='append', type=int,
+        metavar='N',
+        help='number of workers to measure; may be repeated (default: '
+             '1, 2 and 4)')
+    workers_parser.add_argument('--chunk-size', type=int, default=256,
+        metavar='N',
+        help='number of tweets per chunk of work (default: 256)')
+    workers_parser.set_defaults(run=workers)
+    delta_parser = subparsers.add_parser('delta',
+        help='measure applying a delta and lookups around it')
+    delta_parser.add_argument('tweets_file', metavar='tweets_path',
+        help='file of tweets to resolve')
+    delta_parser.add_argument('--order', metavar='RESOLVERS',
+        help='resolver order (comma-separated)')
+    delta_parser.add_argument('--locations', metavar='PATH',
+        dest='location_file',
+        help='path to alternative location database')
+    delta_parser.add_argument('--changes', type=int, default=10,
+        metavar='N',
+        help='number of locations the delta updates (default: 10)')
+    delta_parser.add_argument('--repeat', type=int, default=3,
+        help='number of timed runs over the tweets (default: 3)')
+    delta_parser.set_defaults(run=delta)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Check that resolving columns agrees with resolving tweets.
+
+Usage::
+
+    python -m carmen.scripts.check_dataframe [--locations PATH]
+        [--rows N]
+
+A DataFrame is built from the first *N* known locations, with each
+location's coordinates and its name as a profile location, along with
+rows holding only one of the two and a row holding neither.  Each row
+is resolved by :py:func:`carmen.resolve_dataframe`, both with a
+resolver collection and with each of its ``geocode`` and ``profile``
+resolvers on its own, and as a tweet by the same resolver's
+``resolve_tweet``.  Any row on which the two disagree is printed.  The
+exit status is 1 if any row differs, and 2 if pandas is not installed.
+"""
+from __future__ import print_function
+
+import argparse
+import sys
+import warnings
+
+import carmen
+from carmen.dataframe import resolve_dataframe
+from carmen.location import read_locations
+from carmen.resolver import Resolution
+
+
+def build_rows(location_file, count):
+    """Return a list of ``(lat, lon, user_location)`` rows."""
+    rows = [(None, None, None)]
+    for _, fields in read_locations(location_file):
+        if len(rows) > 3 * count:
+            break
+        if fields is None or not fields.get('city'):
+            continue
+        lat, lon = fields.get('latitude'), fields.get('longitude')
+        lat = float(lat) if lat not in (None, '') else None
+        lon = float(lon) if lon not in (None, '') else None
+        name = ', '.join(filter(None, (fields.get('city'),
+                                       fields.get('state'))))
+        rows.append((lat, lon, name))
+        rows.append((lat, lon, None))
+        rows.append((None, None, name))
+    return rows
+
+
+def row_tweet(lat, lon, name):
+    tweet = {}
+    if lat is not None and lon is not None:
+        tweet['coordinates'] = {'coordinates': [lon, lat]}
+    if name is not None:
+        tweet['user'] = {'location': name}
+    return tweet
+
+
+def compare(label, resolver, name, frame, rows):
+    """Return the number of *rows* on which :py:func:`resolve_dataframe`
+    and ``resolve_tweet`` of *resolver* disagree, printing each.  *name*
+    is the method expected of a single resolver, or None for a
+    collection."""
+    result = resolve_dataframe(frame, resolver)
+    differences = 0
+    for i, row in enumerate(rows):
+        expected = resolver.resolve_tweet(row_tweet(*row))
+        if name is not None:
+            expected = Resolution.of(expected, name)
+        actual_id = result['id'].iloc[i]
+        actual_method = result['resolution_method'].iloc[i]
+        if expected is None:
+            same = actual_method is None or actual_method != actual_method
+        else:
+            same = (actual_id == expected.location.id and
+                    actual_method == expected.method)
+        if not same:
+            differences += 1
+            print('MISMATCH %s row %d %r: %r != %s/%r' % (
+                label, i, row, expected, actual_method, actual_id))
+    return differences
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare resolve_dataframe with resolve_tweet.')
+    parser.add_argument('--locations', metavar='PATH', dest='location_file',
+        help='path to alternative location database')
+    parser.add_argument('--rows', metavar='N', type=int, default=500,
+        help='number of locations to build rows from (default: 500)')
+    args = parser.parse_args(argv)
+    try:
+        import pandas as pd
+    except ImportError:
+        print('pandas is not installed.', file=sys.stderr)
+        return 2
+    warnings.simplefilter('ignore')
+    resolver = carmen.get_resolver(order=['geocode', 'profile'])
+    resolver.load_locations(location_file=args.location_file)
+    rows = build_rows(args.location_file, args.rows)
+    frame = pd.DataFrame(rows, columns=['lat', 'lon', 'user_location'])
+    differences = compare('collection', resolver, None, frame, rows)
+    for name, child in resolver.resolvers:
+        differences += compare(name, child, name, frame, rows)
+    checked = len(rows) * (1 + len(resolver.resolvers))
+    print('%d differences in %d rows.' % (differences, checked))
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
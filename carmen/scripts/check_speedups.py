@@ -0,0 +1,143 @@
+"""Check that the compiled extension agrees with the pure-Python code.
+
+Usage::
+
+    python -m carmen.scripts.check_speedups [--locations PATH]
+        [--random N] [--seed N]
+
+Each input is normalized by both implementations of
+:py:func:`carmen.resolvers.profile.normalize`, with and without
+*preserve_commas*, and any difference is printed.  Inputs are a fixed
+set of awkward strings, every alias in the location database, and
+random strings drawn from a mix of ASCII, punctuation, whitespace and
+non-ASCII characters.  The timing of both implementations on the
+aliases is printed at the end.  The exit status is 1 if any result
+differs, and 2 if the extension is not built.
+"""
+from __future__ import print_function
+
+import argparse
+import json
+import random
+import sys
+import time
+
+from carmen.location import read_locations
+from carmen.resolvers.profile import _py_normalize
+
+
+FIXED_CASES = [
+    '',
+    ' ',
+    ',',
+    ' , ',
+    'Baltimore, MD',
+    '  Baltimore ,  MD  ',
+    'Washington, D.C.',
+    'St. John\'s, NL',
+    'New\tYork\n\nCity',
+    'Zürich, Schweiz',
+    'İstanbul',
+    'ΣΊΣΥΦΟΣ',
+    'Straße',
+    '東京都, 日本',
+    'São Paulo — Brasil',
+    'under_score',
+    '!!!',
+    'a!!b',
+    'a  b',
+    'a​b',
+    'a\x1cb\x1d\x1e\x1fc',
+    '<CITY>, <ADMIN>, <COUNTRY>',
+    '<CI<ADMIN>TY>',
+    '<<CITY>CITY>',
+    'Paris <COUNTRY>France',
+    '\U0001f600 Los Angeles \U0001f334',
+    '١٢٣ Cairo',
+    'ﬁne',
+]
+
+ALPHABET = (
+    'abcxyzABCXYZ0189_'
+    ' \t\n\r\x0b\x0c\x1c\x85  　'
+    ',.;:!?-\'"()/<>'
+    'éüßİıǅΣσςДж東京́​\U0001f600\U00010400'
+)
+
+
+def random_cases(count, seed):
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield ''.join(rng.choice(ALPHABET)
+                      for _ in range(rng.randint(0, 24)))
+
+
+def read_aliases(location_file):
+    aliases = []
+    for _, fields in read_locations(location_file):
+        if fields is not None:
+            aliases.extend(fields.get('aliases') or ())
+    return aliases
+
+
+def compare(fast, cases):
+    """Return the number of *cases* for which *fast* and the pure-Python
+    implementation differ, printing each difference."""
+    differences = 0
+    for case in cases:
+        for preserve_commas in (False, True):
+            expected = _py_normalize(case, preserve_commas=preserve_commas)
+            actual = fast(case, preserve_commas=preserve_commas)
+            if (type(actual) is not type(expected) or actual != expected or
+                    actual.encode('utf-8', 'surrogatepass') !=
+                    expected.encode('utf-8', 'surrogatepass')):
+                differences += 1
+                print('MISMATCH %s (preserve_commas=%s): %s != %s' % (
+                    json.dumps(case), preserve_commas, json.dumps(actual),
+                    json.dumps(expected)))
+    return differences
+
+
+def time_normalize(function, names, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for name in names:
+            function(name)
+            function(name, preserve_commas=True)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Compare the compiled and pure-Python implementations '
+                    'of location name normalization.')
+    parser.add_argument('--locations', metavar='PATH', dest='location_file',
+        help='path to alternative location database')
+    parser.add_argument('--random', metavar='N', type=int, default=100000,
+        help='number of random strings to check (default: 100000)')
+    parser.add_argument('--seed', metavar='N', type=int, default=0,
+        help='random seed (default: 0)')
+    args = parser.parse_args(argv)
+    try:
+        from carmen._speedups import normalize as fast_normalize
+    except ImportError:
+        print('The carmen._speedups extension is not built.', file=sys.stderr)
+        return 2
+    aliases = read_aliases(args.location_file)
+    differences = compare(fast_normalize, FIXED_CASES)
+    differences += compare(fast_normalize, aliases)
+    differences += compare(fast_normalize, random_cases(args.random, args.seed))
+    checked = len(FIXED_CASES) + len(aliases) + args.random
+    print('%d differences in %d strings.' % (differences, checked))
+    python_time = time_normalize(_py_normalize, aliases)
+    compiled_time = time_normalize(fast_normalize, aliases)
+    print('Normalizing %d aliases: %.3fs in Python, %.3fs compiled.' % (
+        len(aliases), python_time, compiled_time))
+    return 1 if differences else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
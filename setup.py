@@ -1,4 +1,4 @@
-from setuptools import setup, find_packages
+from setuptools import setup, find_packages, Extension
 
 setup(
     name='carmen',
@@ -9,9 +9,20 @@ setup(
     url='https://github.com/mdredze/carmen-python',
     packages=find_packages(),
     package_data={'carmen': ['data/*']},
+    # Carmen falls back to pure Python if the extension cannot be built.
+    ext_modules=[
+        Extension('carmen._speedups', ['carmen/_speedups.c'], optional=True),
+    ],
     install_requires=[
         'geopy>=1.11.0',
         'jsonlines>=3.1.0',
     ],
+    entry_points={
+        'console_scripts': ['carmen = carmen.cli:main'],
+    },
+    extras_require={
+        'dataframe': ['numpy', 'pandas'],
+        'polygon': ['numpy'],
+    },
     license='2-clause BSD',
-    zip_safe=True)
+    zip_safe=False)